@@ -1,9 +1,17 @@
 import numpy as np
 import time
-import gc
-from env.ChainReaction import Cell, Game, getNewGame
+import weakref
+from env.ChainReaction import Game, getNewGame
 from configs.defaultConfigs import config
-from models.ResnetFeatures import IntuitionPolicy
+from models.inference import InferenceModel
+from algo.evaluationCache import EvaluationCache
+from algo.evaluators import Evaluator
+from algo.tablebase import Tablebase
+from utils.instrumentation import Instrumentation, getInstrumentation
+from utils.symmetry import getPermutations, transformStates, inverseTransformProbs
+from utils.buffer import Buffer
+from utils.gameRecords import getGameRecordWriter
+from utils.misc import transform
 
 #Use this class to represent any generic action. Not using this now to speed up implementation
 class Action(object):
@@ -22,37 +30,105 @@ class Action(object):
         return not(self==other)
 
 class TreeNode(object):
+    """
+    Statistics of all edges leaving a node are stored in arrays indexed by child position, children[i] is reached by
+    playing the flattened move moves[i]. A node without children is a leaf that has not been evaluated yet.
+    Children are materialized lazily: children[i] stays None until the edge is selected for the first time.
+    """
+    __slots__ = ('game', 'outcome', 'selectedAction', 'intuitionProbs', 'analysisProbs',
+                 'moves', 'children', 'n', 'w', 'q', 'p', 'totalN', 'simulations', '__weakref__')
+
     def __init__(self, game: Game):
-        self.edges = {}
         self.game = game
         self.outcome = 0
         self.selectedAction = None
         self.intuitionProbs = None
         self.analysisProbs = None
+        self.moves = None # flattened valid moves, sorted
+        self.children = None
+        self.n = None # visit counts
+        self.w = None # total action values
+        self.q = None # average action values
+        self.p = None # prior probabilities assigned by the Intuition policy
+        self.totalN = 0
+        self.simulations = 0 # simulations spent searching a move from this node
+
+    def isLeaf(self):
+        return self.children is None
+
+    def setEdges(self, moves, priors, children):
+        self.moves = moves
+        self.children = children
+        self.n = np.zeros(len(moves), dtype=float)
+        self.w = np.zeros(len(moves), dtype=float)
+        self.q = np.zeros(len(moves), dtype=float)
+        self.p = priors
+        self.totalN = 0
+
+    def getChildIdx(self, flattenedMove):
+        childIdx = int(np.searchsorted(self.moves, flattenedMove))
+        if(childIdx == len(self.moves) or self.moves[childIdx] != flattenedMove):
+            raise PermissionError(f'Invalid move: {flattenedMove} is not a valid move of player {self.game.curPlayer}')
+        return childIdx
+
+    def addObservation(self, childIdx, estimatedValue):
+        self.w[childIdx] += estimatedValue
+        self.n[childIdx] += 1
+        self.totalN += 1
+        self.q[childIdx] = self.w[childIdx]/self.n[childIdx]
+
+    def addVirtualLoss(self, childIdx, virtualLoss):
+        """
+        Pretends virtualLoss lost visits went to childIdx so that other descents of the same batch avoid it
+        """
+        self.n[childIdx] += virtualLoss
+        self.w[childIdx] -= virtualLoss
+        self.totalN += virtualLoss
+        self.q[childIdx] = self.w[childIdx]/self.n[childIdx]
 
-class TreeEdge(object):
-    def __init__(self, nextNode: TreeNode, row: int, col: int, p: float, pi: float):
-        self.nextNode = nextNode
-        self.action = (row, col)
-        self.n = 0 # visit count
-        self.w = 0 # total action value
-        self.q = 0 # average action value
-        self.p = p # prior probability assigned by the Intuition policy
-        self.pi = pi
-
-    def addObservation(self, estimatedValue):
-        self.w += estimatedValue
-        self.n += 1
-        self.q = self.w/self.n
+    def revertVirtualLoss(self, childIdx, virtualLoss):
+        self.n[childIdx] -= virtualLoss
+        self.w[childIdx] += virtualLoss
+        self.totalN -= virtualLoss
+        self.q[childIdx] = self.w[childIdx]/self.n[childIdx] if self.n[childIdx] > 0 else 0
 
 class SearchTree(object):
-    def __init__(self, root: TreeNode, intuitionPolicy: IntuitionPolicy):
+    """
+    Leaves are evaluated by intuitionPolicy, any Evaluator or the Keras IntuitionPolicy.
+    stats counts, over the lifetime of the tree, the edges created by expansions (edgesCreated), the child states
+    actually materialized because a descent went through them (statesCreated), the materialized children that were
+    already in the tree through another move order (transpositionHits), the simulations run, the searches that stopped
+    early, the moves played without search because they were the only valid move (forcedMoves) and the leaves valued
+    by the tablebase (tablebaseHits).
+    With config.useTranspositionTable, nodes are shared between all paths reaching the same position. The table only
+    holds weak references so that rerooting still frees the unreachable part of the tree.
+    With a tablebase, leaves that it knows or can solve within tablebaseMaxNodes get their exact value and uniform priors
+    instead of being evaluated by the intuition policy.
+    Moves played with next() are reported to instrumentation, the process wide one from config by default.
+    """
+    def __init__(self, root: TreeNode, intuitionPolicy: Evaluator, evaluationCache: EvaluationCache = None,
+                 tablebase: Tablebase = None, instrumentation: Instrumentation = None):
         self.gameTrace = list()
+        self.instrumentation = instrumentation if instrumentation is not None else getInstrumentation()
         self.root = root
         self.intuitionPolicy = intuitionPolicy
+        self.evaluationCache = evaluationCache
+        self.tablebase = tablebase
+        self.tablebaseMaxMoves = config.tablebaseMaxMoves
+        self.tablebaseMaxNodes = config.tablebaseMaxNodes
+        self.symmetryEvaluation = config.symmetryEvaluation
+        self.transpositions = weakref.WeakValueDictionary() if config.useTranspositionTable else None
+        if(self.transpositions is not None):
+            self.transpositions[root.game.hash] = root
         self.cUB = config.cUB
         self.simulationsPerMove = config.simulationsPerMove
+        self.searchBatchSize = config.searchBatchSize
+        self.virtualLoss = config.virtualLoss
         self.temperature = config.initialTemperature
+        self.searchTimeBudget = config.searchTimeBudget
+        self.earlyStopping = config.earlyStopping
+        self.stats = {'edgesCreated': 0, 'statesCreated': 0, 'transpositionHits': 0, 'simulations': 0, 'earlyStops': 0,
+                      'forcedMoves': 0, 'tablebaseHits': 0}
 
     def _flattenMove(self, move):
         return move[0]*self.root.game.totalCols + move[1]
@@ -60,131 +136,352 @@ class SearchTree(object):
     def _unflattenMove(self, flattenedMove):
         return (flattenedMove//self.root.game.totalCols, flattenedMove%self.root.game.totalCols)
 
-    def _getFlattenedValidMovesMask(self, validMoves):
-        mask = np.zeros(shape=(self.root.game.totalRows, self.root.game.totalCols), dtype = float)
-        validMoves = tuple(zip(*validMoves))
-        mask[validMoves] = 1.0
-        return mask.flatten()
-
-    def sanitizeActionProbs(self, actionProbs, validMoves):
-        validMovesMask = self._getFlattenedValidMovesMask(validMoves)
+    def sanitizeActionProbs(self, actionProbs, game: Game):
+        validMovesMask = game.getValidMovesMask().ravel()
         actionProbs = actionProbs * validMovesMask
         totalProbs = np.sum(actionProbs)
         actionProbs /= totalProbs
         return actionProbs
 
     #sets the selectedAction, analysisProbs and intuitionProbs in the root node. returns nothing
-    def searchMove(self):
-        for i in range(self.simulationsPerMove):
-            self.select(self.root)
-
-        analysisProbs = np.zeros(shape=(self.root.game.totalRows * self.root.game.totalCols), dtype=float)
-        for move, edge in self.root.edges.items():
-            analysisProbs[self._flattenMove(move)] = edge.n**(1/self.temperature)
+    def searchMove(self, maxSimulations = None, timeBudget = None):
+        """
+        Runs at most maxSimulations simulations (simulationsPerMove by default) and, if timeBudget is given, stops
+        starting new batches once that many seconds have passed. With earlyStopping the search also ends as soon as no
+        other root move can reach the visit count of the most visited one within the remaining simulations.
+        Positions with a single valid move are not searched at all. The simulations spent are stored in root.simulations
+        """
+        if(self.root.game.getReward()[1]):
+            raise ValueError('The game is over')
+        if(maxSimulations is None):
+            maxSimulations = self.simulationsPerMove
+        if(timeBudget is None):
+            timeBudget = self.searchTimeBudget
+        totalCells = self.root.game.totalRows * self.root.game.totalCols
+        validMoves = self.root.game.getValidMoves()
+
+        if(len(validMoves) == 1):
+            analysisProbs = np.zeros(shape=(totalCells), dtype=float)
+            analysisProbs[self._flattenMove(validMoves[0])] = 1.
+            if(self.root.intuitionProbs is None):
+                self.root.intuitionProbs = analysisProbs
+            self.root.analysisProbs = analysisProbs
+            self.root.selectedAction = validMoves[0]
+            self.root.simulations = 0
+            self.stats['forcedMoves'] += 1
+            return
+
+        deadline = time.perf_counter() + timeBudget if timeBudget is not None else None
+        simulations = 0
+        # the root needs visited children to choose from, whatever the budget
+        while simulations < maxSimulations or self.root.isLeaf() or self.root.totalN == 0:
+            simulations += self.simulateBatch(min(self.searchBatchSize, max(1, maxSimulations - simulations)))
+            if(self.root.isLeaf() or self.root.totalN == 0):
+                continue
+            if(deadline is not None and time.perf_counter() >= deadline):
+                break
+            if(self.earlyStopping and self._isDecided(maxSimulations - simulations)):
+                self.stats['earlyStops'] += 1
+                break
+        self.root.simulations = simulations
+        self.stats['simulations'] += simulations
+
+        analysisProbs = np.zeros(shape=(totalCells), dtype=float)
+        # scaled by the largest count first, small temperatures would overflow otherwise
+        analysisProbs[self.root.moves] = (self.root.n/self.root.n.max())**(1/self.temperature)
 
         totalProb = analysisProbs.sum()
         analysisProbs /= totalProb
 
         self.root.analysisProbs = analysisProbs
-        sampledMove = np.random.choice(self.root.game.totalRows*self.root.game.totalCols, 1, p = analysisProbs)[0]
-        self.root.selectedAction = self._unflattenMove(sampledMove)
+        sampledMove = np.random.choice(totalCells, 1, p = analysisProbs)[0]
+        self.root.selectedAction = self._unflattenMove(int(sampledMove))
 
-
-    def select(self, curNode: TreeNode):
+    def _isDecided(self, remainingSimulations):
         """
-
-        :param curNode:
+        :return: True if the most visited root move stays the most visited whatever the remaining simulations do
         """
-        intuitionProbs = curNode.intuitionProbs
-        validMoves = curNode.game.getValidMoves()
-
-        #if curNode is a leaf node then call expand on it
-        if(len(curNode.edges)==0):
-            return self.expand(curNode)
-
-
-        bestMove = None
-        bestUCB = -1
-
-        totalN = 0
-        for move, edge in curNode.edges.items():
-            totalN += edge.n
+        if(len(self.root.n) < 2):
+            return True
+        secondN, bestN = np.partition(self.root.n, -2)[-2:]
+        return bestN - secondN > remainingSimulations
 
-        for move, edge in curNode.edges.items():
-            ucb = edge.q + self.cUB*edge.p*(np.sqrt(totalN+1)/(edge.n+1))
-            if(ucb>=bestUCB):
-                bestUCB = ucb
-                bestMove = move
-
-        # multiply -1 because every select method returns the state evaluation for the node itself.
-        # The current node is adversary of its child. Hence less for child is more for parent (how ironic :P)
-        estimatedValue = -1 * self.select(curNode.edges[bestMove].nextNode)
-        curNode.edges[bestMove].addObservation(estimatedValue)
-        return estimatedValue
-
-    def expand(self, curNode: TreeNode):
-        if(curNode.game.getReward()[1]==True):
-            return -1
-        policyInput = transform(curNode.game)
-        policyInput = np.expand_dims(policyInput, axis=0)
-        (intuitionProbs, intuitionValue, _) = self.intuitionPolicy(policyInput)
-        intuitionProbs = intuitionProbs.numpy()
-        intuitionProbs = np.squeeze(intuitionProbs)
-        validMoves = curNode.game.getValidMoves()
-        intuitionProbs = self.sanitizeActionProbs(intuitionProbs, validMoves)
-        curNode.intuitionProbs = intuitionProbs
-
-        for move in validMoves:
-            nextState = curNode.game.getNextState(move)
-            nextNode = TreeNode(nextState)
-            curNode.edges[move] = TreeEdge(nextNode, move[0], move[1], intuitionProbs[self._flattenMove(move)], 0.)
+    def simulateBatch(self, batchSize):
+        """
+        Descends from the root up to batchSize times, using virtual loss to spread the descents over different leaves,
+        evaluates all the new leaves with a single call to the intuition policy and backs up every result.
+        Collecting stops early if a descent ends on a leaf that is already waiting for evaluation.
+        :return: number of simulations actually run, at least 1
+        """
+        instrumentation = self.instrumentation
+        if(instrumentation.active):
+            t1 = time.perf_counter()
+        pendingLeaves = []
+        pendingPaths = []
+        simulations = 0
+        for i in range(batchSize):
+            leaf, path = self.select(self.root)
+            if(instrumentation.active):
+                instrumentation.addDepth(len(path))
+            if(leaf.game.getReward()[1]==True):
+                self.backup(path, -1)
+            elif(any(leaf is pendingLeaf for pendingLeaf in pendingLeaves)):
+                self.backup(path, None)
+                break
+            else:
+                pendingLeaves.append(leaf)
+                pendingPaths.append(path)
+            simulations += 1
+
+        if(len(pendingLeaves) > 0):
+            if(instrumentation.active):
+                instrumentation.addTime('selection', t1)
+                t1 = time.perf_counter()
+            intuitionValues = self.expand(pendingLeaves)
+            if(instrumentation.active):
+                instrumentation.addTime('expansion', t1)
+                t1 = time.perf_counter()
+            for path, intuitionValue in zip(pendingPaths, intuitionValues):
+                self.backup(path, intuitionValue)
+            if(instrumentation.active):
+                instrumentation.addTime('backup', t1)
+        elif(instrumentation.active):
+            instrumentation.addTime('selection', t1)
+        return simulations
 
-        return intuitionValue.numpy()
+    def select(self, curNode: TreeNode):
+        """
+        Follows the children with the highest upper confidence bound until a leaf is reached, adding virtual loss to
+        every edge on the way
+        :param curNode: node to start the descent from
+        :return: (leaf, path) where path is the list of (node, childIdx) taken
+        """
+        path = []
+        while(not curNode.isLeaf()):
+            ucb = curNode.q + self.cUB*curNode.p*(np.sqrt(curNode.totalN+1)/(curNode.n+1))
+            bestIdx = int(np.argmax(ucb))
+            curNode.addVirtualLoss(bestIdx, self.virtualLoss)
+            path.append((curNode, bestIdx))
+            curNode = self._getChild(curNode, bestIdx)
+        return curNode, path
+
+    def _getChild(self, curNode: TreeNode, childIdx):
+        child = curNode.children[childIdx]
+        if(child is None):
+            move = self._unflattenMove(int(curNode.moves[childIdx]))
+            if(self.instrumentation.active):
+                t1 = time.perf_counter()
+                nextState = curNode.game.getNextState(move)
+                self.instrumentation.addTime('stateCopy', t1)
+            else:
+                nextState = curNode.game.getNextState(move)
+            self.stats['statesCreated'] += 1
+            if(self.transpositions is not None):
+                child = self.transpositions.get(nextState.hash)
+                if(child is not None):
+                    self.stats['transpositionHits'] += 1
+                else:
+                    child = TreeNode(nextState)
+                    self.transpositions[nextState.hash] = child
+            else:
+                child = TreeNode(nextState)
+            curNode.children[childIdx] = child
+        return child
+
+    def backup(self, path, estimatedValue):
+        """
+        Removes the virtual loss from path and, unless estimatedValue is None, records the value on every edge
+        :param estimatedValue: value of the leaf at the end of path for the player to move there
+        """
+        for curNode, childIdx in reversed(path):
+            curNode.revertVirtualLoss(childIdx, self.virtualLoss)
+            if(estimatedValue is not None):
+                # multiply -1 because the value is for the player to move at the child.
+                # The current node is adversary of its child. Hence less for child is more for parent (how ironic :P)
+                estimatedValue = -1 * estimatedValue
+                curNode.addObservation(childIdx, estimatedValue)
+
+    def evaluate(self, policyInput):
+        """
+        Runs the intuition policy on a batch of inputs in a single call. Depending on symmetryEvaluation every input is
+        evaluated as is, under one random symmetry of the board or under all of them with the results averaged
+        :return: (intuitionProbs, intuitionValues) with shapes (N, totalRows*totalCols) and (N,)
+        """
+        numInputs, totalRows, totalCols, _ = policyInput.shape
+        numSymmetries = len(getPermutations(totalRows, totalCols))
+        symmetryIdxs = None
+        if(self.symmetryEvaluation == 'random'):
+            symmetryIdxs = np.random.randint(numSymmetries, size=numInputs)
+        elif(self.symmetryEvaluation == 'average'):
+            symmetryIdxs = np.tile(np.arange(numSymmetries), numInputs)
+            policyInput = np.repeat(policyInput, numSymmetries, axis=0)
+        if(symmetryIdxs is not None):
+            policyInput = transformStates(policyInput, symmetryIdxs)
+
+        if(self.instrumentation.active):
+            t1 = time.perf_counter()
+            (intuitionProbs, intuitionValues, _) = self.intuitionPolicy(policyInput)
+            self.instrumentation.addTime('evaluation', t1)
+            self.instrumentation.addEvaluation(len(policyInput))
+        else:
+            (intuitionProbs, intuitionValues, _) = self.intuitionPolicy(policyInput)
+        intuitionProbs = np.reshape(np.asarray(intuitionProbs), (len(policyInput), -1))
+        intuitionValues = np.reshape(np.asarray(intuitionValues), (len(policyInput),))
+
+        if(symmetryIdxs is not None):
+            intuitionProbs = inverseTransformProbs(intuitionProbs, symmetryIdxs, totalRows, totalCols)
+        if(self.symmetryEvaluation == 'average'):
+            intuitionProbs = intuitionProbs.reshape(numInputs, numSymmetries, -1).mean(axis=1)
+            intuitionValues = intuitionValues.reshape(numInputs, numSymmetries).mean(axis=1)
+        return intuitionProbs, intuitionValues
+
+    def expand(self, leaves):
+        """
+        Evaluates all leaves whose position is neither solved by the tablebase nor in the evaluation cache in one batch
+        and creates their children
+        :return: the intuition value of every leaf
+        """
+        leafProbs = [None] * len(leaves)
+        leafValues = np.zeros(len(leaves), dtype=float)
+        uncachedIdxs = []
+        for i, leaf in enumerate(leaves):
+            if(self.tablebase is not None):
+                solvedValue = self.tablebase.probe(leaf.game, self.tablebaseMaxMoves, self.tablebaseMaxNodes)
+                if(solvedValue is not None):
+                    leafProbs[i] = self.sanitizeActionProbs(np.ones(leaf.game.totalRows * leaf.game.totalCols), leaf.game)
+                    leafValues[i] = solvedValue
+                    self.stats['tablebaseHits'] += 1
+                    continue
+            cached = self.evaluationCache.get(leaf.game.hash) if self.evaluationCache is not None else None
+            if(cached is None):
+                uncachedIdxs.append(i)
+            else:
+                leafProbs[i], leafValues[i] = cached
+
+        if(len(uncachedIdxs) > 0):
+            intuitionProbs, intuitionValues = self.evaluate(np.stack([transform(leaves[i].game) for i in uncachedIdxs]))
+            for i, probs, value in zip(uncachedIdxs, intuitionProbs, intuitionValues):
+                leafProbs[i] = self.sanitizeActionProbs(probs, leaves[i].game)
+                leafValues[i] = value
+                if(self.evaluationCache is not None):
+                    self.evaluationCache.put(leaves[i].game.hash, leafProbs[i], leafValues[i])
+
+        for curNode, probs in zip(leaves, leafProbs):
+            curNode.intuitionProbs = probs
+            moves = np.flatnonzero(curNode.game.getValidMovesMask())
+            curNode.setEdges(moves, probs[moves], [None] * len(moves))
+            self.stats['edgesCreated'] += len(moves)
+
+        return leafValues
 
     def next(self):
         """
         Moves the actual game ahead by 1 step. A move is searched by mcts and stored in the current root
         :return: (reward, isTerminal): a tuple indicating the reward and the fact if the state is terminal
         """
-        self.root.game.printGrid()
-        t1 = time.time()
+        instrumentation = self.instrumentation
+        instrumentation.startMove()
+        searchedRoot = self.root
+        if(instrumentation.active):
+            t1 = time.perf_counter()
         self.searchMove()
-        t2 = time.time()
-        print(f'Played move: {self.root.selectedAction}. Time taken: {t2-t1}')
-        self.gameTrace.append(self.root)
-        newRoot = self.root.edges[self.root.selectedAction].nextNode
-        self.root.edges = {}
+        treeSize = 0
+        if(instrumentation.active):
+            instrumentation.addTime('search', t1)
+            treeSize = self.getTreeSize()
+        self.gameTrace.append(searchedRoot)
+        rewardTuple = self.advance(searchedRoot.selectedAction)
+        instrumentation.endMove(searchedRoot, treeSize, self.root.game)
+        return rewardTuple
+
+    def advance(self, move):
+        """
+        Reroots the tree on the position reached by playing move, keeping everything already searched below it. Used
+        directly to follow moves that were chosen outside of this tree
+        :return: (reward, isTerminal) of the new root
+        """
+        if(self.instrumentation.active):
+            t1 = time.perf_counter()
+        if(self.root.isLeaf()):
+            newRoot = TreeNode(self.root.game.getNextState(move))
+            if(self.transpositions is not None):
+                self.transpositions[newRoot.game.hash] = newRoot
+        else:
+            newRoot = self._getChild(self.root, self.root.getChildIdx(self._flattenMove(move)))
+        # the old root may stay in gameTrace, dropping its children frees the siblings of newRoot by reference counting
+        self.root.children = None
         self.root = newRoot
-        gc.collect()
+        if(self.instrumentation.active):
+            self.instrumentation.addTime('reroot', t1)
         return self.root.game.getReward()
 
-from utils.buffer import *
-from utils.misc import transform
+    def getTreeSize(self):
+        """
+        :return: number of distinct nodes reachable from the root
+        """
+        seen = set()
+        stack = [self.root]
+        while stack:
+            curNode = stack.pop()
+            if(id(curNode) in seen):
+                continue
+            seen.add(id(curNode))
+            if(not curNode.isLeaf()):
+                stack.extend(child for child in curNode.children if child is not None)
+        return len(seen)
+
+def playGame(intuitionPolicy: Evaluator, evaluationCache: EvaluationCache = None, tablebase: Tablebase = None):
+    """
+    Plays one self-play game from a new game
+    :return: the gameTrace of the game with the outcome of every position filled in
+    """
+    searchTree = SearchTree(TreeNode(getNewGame()), intuitionPolicy, evaluationCache, tablebase)
+    rewardTuple = (0, False)
+    while(rewardTuple[1] == False):
+        rewardTuple = searchTree.next()
+    searchTree.instrumentation.endGame()
+
+    gameTrace = searchTree.gameTrace
+    multiplier = 1
+    for i in range(len(gameTrace)-1, -1, -1):
+        gameTrace[i].outcome = -1*multiplier
+        multiplier *= -1
+    return gameTrace
+
+def getTablebase():
+    """
+    :return: the tablebase in config.tablebaseDir for the configured board, None if it is disabled
+    """
+    if(config.tablebaseDir is None):
+        return None
+    return Tablebase(config.totalRows, config.totalCols, config.numPlayers, config.tablebaseDir)
 
 class ExperienceCollector(object):
-    def __init__(self):
-        self.buffer = Buffer(config.totalRows, config.totalCols, config.numPlayers)
-
-    def collectExperience(self, numGames: int, intuitionPolicy: IntuitionPolicy):
+    def __init__(self, buffer = None):
+        self.buffer = buffer if buffer is not None else Buffer(config.totalRows, config.totalCols, config.numPlayers,
+                                                                 config.replayBufferSize, config.replayBufferDir,
+                                                                 config.replayShardSize)
+        self.evaluationCache = EvaluationCache(config.evaluationCacheSize)
+        self.tablebase = getTablebase()
+        self.gameRecords = getGameRecordWriter()
+
+    def collectExperience(self, numGames: int, intuitionPolicy: Evaluator):
         """
         Call to collect experience. Right now only experience collection with 2 players is supported. Do not call this with numPlayers>2
         :param numGames: number of self-play games before policy evaluation and improvement stage
         """
+        if(config.useInferenceModel and not isinstance(intuitionPolicy, Evaluator)):
+            intuitionPolicy = InferenceModel(intuitionPolicy)
         for iter in range(numGames):
-            searchTree = SearchTree(TreeNode(getNewGame()), intuitionPolicy)
-            rewardTuple = (0, False)
-            while(rewardTuple[1] == False):
-                rewardTuple = searchTree.next()
-
-            gameTrace = searchTree.gameTrace
-            multiplier = 1
-            for i in range(len(gameTrace)-1, -1, -1):
-                gameTrace[i].outcome = -1*multiplier
-                multiplier *= -1
-
-            self.buffer.addData(searchTree.gameTrace)
+            gameTrace = playGame(intuitionPolicy, self.evaluationCache, self.tablebase)
+            self.buffer.addData(gameTrace)
+            if(self.gameRecords is not None):
+                self.gameRecords.write(gameTrace)
+        if(self.tablebase is not None):
+            self.tablebase.save()
 
 if __name__=='__main__':
+    from models.ResnetFeatures import IntuitionPolicy
     exp = ExperienceCollector()
     exp.collectExperience(2, IntuitionPolicy(config.totalRows, config.totalCols, config.numPlayers,
                                              10, 64))
\ No newline at end of file
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+class EvaluationCache(object):
+    """
+    Bounded mapping from a position hash to the (sanitized intuition probs, intuition value) the network returned for it.
+    The least recently used entry is evicted once capacity is reached. Entries are only valid for the weights that
+    produced them, so use one cache per version of the intuition policy.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :return: the cached (intuitionProbs, intuitionValue) for key or None
+        """
+        entry = self.entries.get(key)
+        if(entry is None):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, intuitionProbs, intuitionValue):
+        if(self.capacity <= 0):
+            return
+        self.entries[key] = (intuitionProbs, intuitionValue)
+        self.entries.move_to_end(key)
+        if(len(self.entries) > self.capacity):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hitRate': self.hits/lookups if lookups > 0 else 0.}
@@ -0,0 +1,106 @@
+from abc import ABC, abstractmethod
+import queue
+import time
+import numpy as np
+from env.BatchedChainReaction import BatchedChainReaction
+from utils.misc import inverseTransform
+
+# below this many rollouts per call the per wave numpy overhead of BatchedChainReaction costs more than playing the
+# games one by one
+_MIN_BATCHED_ROLLOUTS = 16
+
+class Evaluator(ABC):
+    """
+    What SearchTree evaluates its leaves with. Calls take a (numInputs, totalRows, totalCols, numPlayers) batch of
+    positions made by utils.misc.transform and return (actionProbs, values, None): (numInputs, totalRows*totalCols)
+    priors over all cells and (numInputs,) values for the player to move. The Keras IntuitionPolicy is used the same way
+    without deriving from this class, everything else that evaluates positions does.
+    """
+    @abstractmethod
+    def __call__(self, policyInput, training = False):
+        pass
+
+def collectRequests(requestQueue, getNumInputs, maxBatchSize, maxWait):
+    """
+    Waits for a request, then keeps collecting until maxBatchSize inputs are pending or maxWait has passed. Used by the
+    inference servers that batch evaluations of several searches, a None request stops them.
+    :return: (requests, number of inputs in requests, False if a None request was received)
+    """
+    request = requestQueue.get()
+    if(request is None):
+        return [], 0, False
+    requests = [request]
+    numInputs = getNumInputs(request)
+    deadline = time.perf_counter() + maxWait
+    while numInputs < maxBatchSize:
+        timeout = deadline - time.perf_counter()
+        if(timeout <= 0):
+            break
+        try:
+            request = requestQueue.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if(request is None):
+            return requests, numInputs, False
+        requests.append(request)
+        numInputs += getNumInputs(request)
+    return requests, numInputs, True
+
+class RolloutEvaluator(Evaluator):
+    """
+    Network free replacement for IntuitionPolicy: every move gets the same prior and the value of a position is the
+    average result of numRollouts games played on from it with uniformly random moves. Rollouts that are still running
+    after maxRolloutMoves moves count as draws. Calls return (actionProbs, values, None) like the Keras model.
+    Large calls play all of their rollouts together on a BatchedChainReaction.
+    """
+    def __init__(self, numRollouts = 1, maxRolloutMoves = 1000, seed = None):
+        self.numRollouts = numRollouts
+        self.maxRolloutMoves = maxRolloutMoves
+        self.rng = np.random.RandomState(seed)
+
+    def _rollout(self, game):
+        """
+        :return: result of one random game played on from game, for the player to move in game
+        """
+        playerIdx = game.curPlayer
+        game = game.clone()
+        for _ in range(self.maxRolloutMoves):
+            if(game.getReward()[1]):
+                # the player to move lost, so the last move won
+                winnerIdx = (game.curPlayer - 1) % game.numPlayers
+                return 1. if winnerIdx == playerIdx else -1.
+            validMoves = game.getValidMoves()
+            game.makeMove(*validMoves[self.rng.randint(len(validMoves))])
+        return 0.
+
+    def _batchedRollout(self, boards):
+        """
+        :return: (batchSize,) results of random games played on from every board, for the player to move on it
+        """
+        playerIdxs = boards.curPlayer.copy()
+        results = np.zeros(boards.batchSize)
+        running = np.ones(boards.batchSize, dtype=bool)
+        for _ in range(self.maxRolloutMoves):
+            ended = running & boards.getTerminal()
+            winnerIdxs = (boards.curPlayer - 1) % boards.numPlayers
+            results[ended] = np.where(winnerIdxs[ended] == playerIdxs[ended], 1., -1.)
+            running &= ~ended
+            if(not running.any()):
+                break
+            moves = boards.getRandomMoves(self.rng)
+            moves[~running] = -1
+            boards.makeMoves(moves)
+        return results
+
+    def __call__(self, policyInput, training = False):
+        numInputs, totalRows, totalCols, _ = policyInput.shape
+        actionProbs = np.full((numInputs, totalRows * totalCols), 1. / (totalRows * totalCols))
+        if(numInputs * self.numRollouts >= _MIN_BATCHED_ROLLOUTS):
+            boards = BatchedChainReaction.fromFeatures(np.repeat(np.asarray(policyInput), self.numRollouts, axis=0))
+            values = self._batchedRollout(boards).reshape(numInputs, self.numRollouts).mean(axis=1)
+            return actionProbs, values, None
+        values = np.zeros(numInputs)
+        for i in range(numInputs):
+            game = inverseTransform(policyInput[i])
+            values[i] = np.mean([self._rollout(game) for _ in range(self.numRollouts)])
+        return actionProbs, values, None
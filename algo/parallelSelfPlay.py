@@ -0,0 +1,203 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
+import time
+import numpy as np
+from configs.defaultConfigs import config
+from models.inference import InferenceModel
+from algo.MCTS import playGame, getTablebase, ExperienceCollector
+from algo.evaluationCache import EvaluationCache
+from algo.evaluators import Evaluator, collectRequests
+from utils.instrumentation import getInstrumentation
+from utils.symmetry import getPermutations
+
+def getConfigValues():
+    return {key: value for key, value in vars(config).items() if not key.startswith('__')}
+
+def applyConfigValues(configValues):
+    # processes are spawned, so changes made to config in the parent are not inherited
+    for key, value in configValues.items():
+        setattr(config, key, value)
+
+def _getMaxLeaves():
+    # evaluating under every symmetry sends that many inputs per leaf
+    if(config.symmetryEvaluation == 'average'):
+        return config.searchBatchSize * len(getPermutations(config.totalRows, config.totalCols))
+    return config.searchBatchSize
+
+class _SharedSlot(object):
+    """
+    Per worker shared memory holding up to maxLeaves policy inputs and the matching outputs. The outputs of a leaf are
+    its intuition probs followed by its intuition value.
+    """
+    def __init__(self, maxLeaves, totalRows, totalCols, numPlayers, names = None):
+        inputShape = (maxLeaves, totalRows, totalCols, numPlayers)
+        outputShape = (maxLeaves, totalRows * totalCols + 1)
+        if(names is None):
+            self.inputMemory = shared_memory.SharedMemory(create=True, size=int(np.prod(inputShape)) * 4)
+            self.outputMemory = shared_memory.SharedMemory(create=True, size=int(np.prod(outputShape)) * 4)
+        else:
+            self.inputMemory = shared_memory.SharedMemory(name=names[0])
+            self.outputMemory = shared_memory.SharedMemory(name=names[1])
+        self.inputs = np.ndarray(inputShape, dtype=np.float32, buffer=self.inputMemory.buf)
+        self.outputs = np.ndarray(outputShape, dtype=np.float32, buffer=self.outputMemory.buf)
+
+    def getNames(self):
+        return (self.inputMemory.name, self.outputMemory.name)
+
+    def close(self, unlink = False):
+        del self.inputs, self.outputs
+        self.inputMemory.close()
+        self.outputMemory.close()
+        if(unlink):
+            self.inputMemory.unlink()
+            self.outputMemory.unlink()
+
+class InferenceClient(Evaluator):
+    """
+    Drop-in replacement for IntuitionPolicy inside self-play workers. Calls copy the batch into the worker's shared slot,
+    notify the inference server and block until it has written the outputs back.
+    """
+    def __init__(self, workerIdx, slot: _SharedSlot, requestQueue, responseQueue):
+        self.workerIdx = workerIdx
+        self.slot = slot
+        self.requestQueue = requestQueue
+        self.responseQueue = responseQueue
+
+    def __call__(self, policyInput, training = False):
+        numLeaves = len(policyInput)
+        self.slot.inputs[:numLeaves] = policyInput
+        self.requestQueue.put((self.workerIdx, numLeaves))
+        self.responseQueue.get()
+        outputs = self.slot.outputs[:numLeaves].copy()
+        return outputs[:, :-1], outputs[:, -1], None
+
+    def close(self):
+        self.slot.close()
+
+def connectClient(clientArgs):
+    """
+    :param clientArgs: InferenceServer.getClientArgs() of the client, called in the process the client is used in
+    """
+    clientIdx, slotNames, requestQueue, responseQueue = clientArgs
+    slot = _SharedSlot(_getMaxLeaves(), config.totalRows, config.totalCols, config.numPlayers, slotNames)
+    return InferenceClient(clientIdx, slot, requestQueue, responseQueue)
+
+def _runInferenceServer(configValues, weights, slotNames, requestQueue, responseQueues):
+    """
+    Evaluates requests of all workers with a single IntuitionPolicy. After the first request arrives the server keeps
+    collecting until inferenceMaxBatchSize leaves are pending or inferenceMaxWait has passed. Stops on a None request.
+    """
+    applyConfigValues(configValues)
+    from models.ResnetFeatures import getIntuitionPolicy
+    intuitionPolicy = getIntuitionPolicy(weights)
+    if(config.useInferenceModel):
+        intuitionPolicy = InferenceModel(intuitionPolicy)
+    slots = [_SharedSlot(_getMaxLeaves(), config.totalRows, config.totalCols, config.numPlayers, names)
+             for names in slotNames]
+
+    running = True
+    while running:
+        requests, batchSize, running = collectRequests(requestQueue, lambda request: request[1],
+                                                       config.inferenceMaxBatchSize, config.inferenceMaxWait)
+        if(not requests):
+            break
+        policyInput = np.concatenate([slots[workerIdx].inputs[:numLeaves] for workerIdx, numLeaves in requests])
+        (intuitionProbs, intuitionValues, _) = intuitionPolicy(policyInput)
+        intuitionProbs = np.reshape(np.asarray(intuitionProbs), (batchSize, -1))
+        intuitionValues = np.reshape(np.asarray(intuitionValues), (batchSize,))
+        offset = 0
+        for workerIdx, numLeaves in requests:
+            slots[workerIdx].outputs[:numLeaves, :-1] = intuitionProbs[offset: offset + numLeaves]
+            slots[workerIdx].outputs[:numLeaves, -1] = intuitionValues[offset: offset + numLeaves]
+            offset += numLeaves
+            responseQueues[workerIdx].put(True)
+
+    for slot in slots:
+        slot.close()
+
+class InferenceServer(object):
+    """
+    Parent side of an inference server process evaluating with weights for numClients clients. The server is started
+    with the current config. Client i is created with connectClient(getClientArgs(i)) in the process that uses it
+    """
+    def __init__(self, context, weights, numClients):
+        self.slots = [_SharedSlot(_getMaxLeaves(), config.totalRows, config.totalCols, config.numPlayers)
+                      for _ in range(numClients)]
+        self.requestQueue = context.Queue()
+        self.responseQueues = [context.Queue() for _ in range(numClients)]
+        self.process = context.Process(target=_runInferenceServer, args=(getConfigValues(), weights,
+                                       [slot.getNames() for slot in self.slots], self.requestQueue, self.responseQueues),
+                                       daemon=True)
+        self.process.start()
+
+    def getClientArgs(self, clientIdx):
+        return (clientIdx, self.slots[clientIdx].getNames(), self.requestQueue, self.responseQueues[clientIdx])
+
+    def stop(self):
+        self.requestQueue.put(None)
+        self.process.join()
+        for slot in self.slots:
+            slot.close(unlink=True)
+
+def _runSelfPlayWorker(configValues, clientArgs, taskQueue, resultQueue):
+    applyConfigValues(configValues)
+    client = connectClient(clientArgs)
+    evaluationCache = EvaluationCache(config.evaluationCacheSize)
+    tablebase = getTablebase()
+    instrumentation = getInstrumentation()
+    while taskQueue.get() is not None:
+        gameTrace = playGame(client, evaluationCache, tablebase)
+        resultQueue.put((gameTrace, instrumentation.takeSummary()))
+    client.close()
+    if(tablebase is not None):
+        tablebase.save()
+
+def _getResult(resultQueue, processes):
+    while True:
+        try:
+            return resultQueue.get(timeout=1.0)
+        except queue.Empty:
+            for process in processes:
+                if(process.exitcode not in (None, 0)):
+                    raise RuntimeError(f'{process.name} exited with code {process.exitcode}')
+
+class ParallelExperienceCollector(ExperienceCollector):
+    """
+    ExperienceCollector that plays the games in numWorkers spawned processes. Workers never run the network themselves,
+    their leaf evaluations are batched across workers by a single inference server process.
+    """
+    def __init__(self, numWorkers: int, buffer = None):
+        super(ParallelExperienceCollector, self).__init__(buffer)
+        self.numWorkers = numWorkers
+
+    def collectExperience(self, numGames: int, intuitionPolicy: Evaluator):
+        context = mp.get_context('spawn')
+        taskQueue = context.Queue()
+        resultQueue = context.Queue()
+        for _ in range(numGames):
+            taskQueue.put(True)
+        for _ in range(self.numWorkers):
+            taskQueue.put(None)
+
+        t1 = time.time()
+        server = InferenceServer(context, intuitionPolicy.get_weights(), self.numWorkers)
+        workers = [context.Process(target=_runSelfPlayWorker, args=(getConfigValues(), server.getClientArgs(workerIdx),
+                   taskQueue, resultQueue), daemon=True)
+                   for workerIdx in range(self.numWorkers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for _ in range(numGames):
+                gameTrace, summary = _getResult(resultQueue, workers + [server.process])
+                getInstrumentation().addSummary(summary)
+                self.buffer.addData(gameTrace)
+                if(self.gameRecords is not None):
+                    self.gameRecords.write(gameTrace)
+            for worker in workers:
+                worker.join()
+        finally:
+            server.stop()
+        t2 = time.time()
+        print(f'Played {numGames} games with {self.numWorkers} workers in {t2-t1:.1f}s ({numGames*3600/(t2-t1):.0f} games/hour)')
@@ -0,0 +1,160 @@
+import argparse
+import os
+import sys
+import time
+from functools import lru_cache
+import numpy as np
+from env.ChainReaction import Game, _getZobristKeys, _MAX_ORBS
+from utils.symmetry import getPermutations
+
+@lru_cache(maxsize=None)
+def _getCellKeys(totalRows, totalCols, numPlayers):
+    cellKeys, _ = _getZobristKeys(totalRows, totalCols, numPlayers)
+    return np.array(cellKeys, dtype=np.int64).reshape(totalRows * totalCols, numPlayers, _MAX_ORBS)
+
+def getCanonicalHash(game: Game):
+    """
+    :return: the smallest Zobrist hash of game over all symmetries of the board, equal for all symmetric positions.
+    The board alone determines the player to move since the number of orbs is the number of moves played
+    """
+    cellKeys = _getCellKeys(game.totalRows, game.totalCols, game.numPlayers)
+    permutations = getPermutations(game.totalRows, game.totalCols)
+    orbs = np.frombuffer(game.orbs, dtype=np.uint8)
+    owners = np.frombuffer(game.owners, dtype=np.uint8)
+    # row k holds the keys of the board transformed by symmetry k, empty cells have key 0 whatever their owner
+    hashes = np.bitwise_xor.reduce(cellKeys[np.arange(len(orbs)), owners[permutations], orbs[permutations]], axis=1)
+    return int(hashes.min()) ^ game.playerKeys[game.curPlayer]
+
+def getMaxRemainingMoves(game: Game):
+    """
+    :return: number of moves after which the game has ended whatever is played. Every move adds an orb and a board
+    holding more orbs than its stable capacity keeps exploding until the mover owns all of them
+    """
+    stableCapacity = sum(game.capacity) - len(game.capacity)
+    return max(stableCapacity - game.totalMoves + 1, 0)
+
+class _OutOfNodes(Exception):
+    pass
+
+class Tablebase(object):
+    """
+    Exact values of 2 player positions, +1 if the player to move wins with perfect play and -1 otherwise, keyed by
+    getCanonicalHash. Positions are solved by a memoized negamax search; outcomes are only wins and losses, so a node is
+    cut off as soon as one move wins. Every position whose value was established while solving is kept, also when the
+    search ran out of nodes. With a directory the table is read from and saved to tablebase_<rows>x<cols>.npz in it.
+    """
+    def __init__(self, totalRows, totalCols, numPlayers = 2, directory = None):
+        if(numPlayers != 2):
+            raise ValueError(f'Tablebase only supports 2 players, got {numPlayers}')
+        self.totalRows = totalRows
+        self.totalCols = totalCols
+        self.directory = directory
+        self.values = {}
+        self.nodes = 0
+        self.maxNodes = None
+        if(directory is not None):
+            self.values = self._load()
+
+    def _getPath(self):
+        return os.path.join(self.directory, f'tablebase_{self.totalRows}x{self.totalCols}.npz')
+
+    def _load(self):
+        if(not os.path.exists(self._getPath())):
+            return {}
+        with np.load(self._getPath()) as table:
+            return dict(zip(table['keys'].tolist(), table['values'].tolist()))
+
+    def save(self):
+        """
+        Writes the table to its directory, merged with what other processes saved there in the meantime. Saves are
+        serialized by an exclusive lock on tablebase_<rows>x<cols>.npz.lock, so concurrent saves never drop entries
+        """
+        if(self.directory is None):
+            return
+        # only available on posix, imported here so that search works everywhere
+        import fcntl
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._getPath()
+        with open(path + '.lock', 'w') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            values = self._load()
+            values.update(self.values)
+            self.values = values
+            tmpPath = f'{path}.{os.getpid()}.tmp'
+            with open(tmpPath, 'wb') as f:
+                np.savez(f, keys=np.fromiter(values.keys(), dtype=np.int64, count=len(values)),
+                         values=np.fromiter(values.values(), dtype=np.int8, count=len(values)))
+            os.replace(tmpPath, path)
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, game: Game):
+        """
+        :return: value of game for the player to move or None if it was never solved
+        """
+        return self.values.get(getCanonicalHash(game))
+
+    def solve(self, game: Game, maxNodes = None):
+        """
+        :param maxNodes: most positions to search before giving up, None searches until solved
+        :return: value of game for the player to move, None if it could not be solved within maxNodes
+        """
+        if(game.getReward()[1]):
+            return -1
+        self.nodes = 0
+        self.maxNodes = maxNodes
+        try:
+            return self._solve(game)
+        except _OutOfNodes:
+            return None
+
+    def _solve(self, game: Game):
+        key = getCanonicalHash(game)
+        value = self.values.get(key)
+        if(value is not None):
+            return value
+        self.nodes += 1
+        if(self.maxNodes is not None and self.nodes > self.maxNodes):
+            raise _OutOfNodes()
+
+        children = []
+        for move in game.getValidMoves():
+            child = game.getNextState(move)
+            if(child.getReward()[1]):
+                self.values[key] = 1
+                return 1
+            children.append(child)
+        value = -1
+        for child in children:
+            if(self._solve(child) == -1):
+                value = 1
+                break
+        self.values[key] = value
+        return value
+
+    def probe(self, game: Game, maxMoves, maxNodes):
+        """
+        Looks game up and, if it is missing and ends within maxMoves moves whatever is played, tries to solve it
+        :return: value of game for the player to move or None
+        """
+        value = self.get(game)
+        if(value is None and getMaxRemainingMoves(game) <= maxMoves):
+            value = self.solve(game, maxNodes)
+        return value
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Solves a board from the first move and saves the tablebase')
+    parser.add_argument('totalRows', type=int)
+    parser.add_argument('totalCols', type=int)
+    parser.add_argument('--directory', default='tablebase')
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * args.totalRows * args.totalCols))
+    tablebase = Tablebase(args.totalRows, args.totalCols, 2, args.directory)
+    t1 = time.time()
+    value = tablebase.solve(Game(args.totalRows, args.totalCols, 2))
+    t2 = time.time()
+    tablebase.save()
+    print(f'{args.totalRows}x{args.totalCols}: the first player {"wins" if value == 1 else "loses"}. '
+          f'Searched {tablebase.nodes} positions in {t2-t1:.1f}s, {len(tablebase)} positions in the tablebase')
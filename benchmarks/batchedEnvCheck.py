@@ -0,0 +1,96 @@
+import argparse
+import sys
+import numpy as np
+from env.ChainReaction import Game, getGameFromPlanes
+from env.BatchedChainReaction import BatchedChainReaction
+from utils.misc import transform
+
+# (totalRows, totalCols, numPlayers) of the boards checked by default
+SHAPES = ((5, 5, 2), (3, 3, 2), (4, 6, 2), (2, 2, 2), (2, 7, 2), (6, 4, 3), (8, 8, 4))
+
+def _compare(boards, games, moves, cascadeLengths):
+    """
+    :return: description of the first difference between boards and games after moves, None if they match
+    """
+    for boardIdx, game in enumerate(games):
+        if(moves[boardIdx] >= 0 and cascadeLengths[boardIdx] != game.lastCascadeLength):
+            return f'board {boardIdx}: cascade {cascadeLengths[boardIdx]} instead of {game.lastCascadeLength}'
+    checks = [
+        ('planes', boards.getPlanes(), np.stack([game.getPlanes() for game in games])),
+        ('valid moves', boards.getValidMovesMask(), np.stack([game.getValidMovesMask() for game in games]).astype(bool)),
+        ('terminal', boards.getTerminal(), np.array([game.getReward()[1] for game in games])),
+        ('curPlayer', boards.curPlayer, np.array([game.curPlayer for game in games])),
+        ('totalMoves', boards.totalMoves, np.array([game.totalMoves for game in games])),
+        ('features', boards.getFeatures(), np.stack([transform(game) for game in games])),
+    ]
+    for name, batched, expected in checks:
+        if(not np.array_equal(batched, expected)):
+            return f'{name} differ on boards {np.flatnonzero((batched != expected).reshape(len(games), -1).any(axis=1))}'
+    if(not np.array_equal(BatchedChainReaction.fromFeatures(boards.getFeatures()).getPlanes(), boards.getPlanes())):
+        return 'fromFeatures does not rebuild the boards'
+    return None
+
+def checkRandomGames(totalRows, totalCols, numPlayers, batchSize, seed):
+    """
+    Plays batchSize random games on a BatchedChainReaction and on Game side by side, finished boards are skipped
+    :return: (number of moves compared, description of the first difference or None)
+    """
+    rng = np.random.RandomState(seed)
+    games = [Game(totalRows, totalCols, numPlayers) for _ in range(batchSize)]
+    boards = BatchedChainReaction(batchSize, totalRows, totalCols, numPlayers)
+    numMoves = 0
+    while not boards.getTerminal().all():
+        moves = boards.getRandomMoves(rng)
+        moves[boards.getTerminal()] = -1
+        cascadeLengths = boards.makeMoves(moves)
+        for boardIdx, game in enumerate(games):
+            if(moves[boardIdx] >= 0):
+                game.makeMove(moves[boardIdx] // totalCols, moves[boardIdx] % totalCols)
+                numMoves += 1
+        difference = _compare(boards, games, moves, cascadeLengths)
+        if(difference is not None):
+            return numMoves, difference
+    return numMoves, None
+
+def checkWorstCascade(totalRows, totalCols):
+    """
+    Compares the move at (0, 0) on the position where it sets off every cell of the board, see
+    benchmarks.suite.getWorstCascadePosition
+    :return: description of the difference or None
+    """
+    planes = np.zeros((totalRows, totalCols, 2), dtype=np.uint8)
+    for i in range(totalRows):
+        for j in range(totalCols):
+            planes[i, j, 0] = (i > 0 and i < totalRows - 1) + (j > 0 and j < totalCols - 1) + 1
+    planes[totalRows - 1, totalCols - 1] = (0, 1)
+    if(planes.sum() % 2 == 1):
+        planes[totalRows // 2, totalCols // 2, 0] -= 1
+    game = getGameFromPlanes(planes)
+    boards = BatchedChainReaction.fromGames([game])
+    moves = np.zeros(1, dtype=np.int64)
+    cascadeLengths = boards.makeMoves(moves)
+    game.makeMove(0, 0)
+    return _compare(boards, [game], moves, cascadeLengths)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Differential check of BatchedChainReaction against Game on random games')
+    parser.add_argument('--boards', type=int, default=64, help='games played together per run')
+    parser.add_argument('--seeds', type=int, default=5, help='runs per board shape')
+    args = parser.parse_args()
+
+    failed = False
+    for totalRows, totalCols, numPlayers in SHAPES:
+        totalMoves = 0
+        for seed in range(args.seeds):
+            numMoves, difference = checkRandomGames(totalRows, totalCols, numPlayers, args.boards, seed)
+            totalMoves += numMoves
+            if(difference is not None):
+                print(f'{totalRows}x{totalCols} {numPlayers} players seed {seed}: {difference}')
+                failed = True
+                break
+        print(f'{totalRows}x{totalCols} {numPlayers} players: {totalMoves} moves compared')
+    for totalRows, totalCols in ((5, 5), (8, 8)):
+        difference = checkWorstCascade(totalRows, totalCols)
+        print(f'{totalRows}x{totalCols} worst cascade: {difference if difference is not None else "ok"}')
+        failed = failed or difference is not None
+    sys.exit(1 if failed else 0)
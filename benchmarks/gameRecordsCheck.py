@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+from env.ChainReaction import Game
+from utils.gameRecords import GameRecordWriter, encodeGame, readGames
+
+def getRandomGameTrace(totalRows, totalCols, numPlayers, rng):
+    """
+    :return: gameTrace of a uniformly random game with random analysisProbs, with the fields encodeGame reads
+    """
+    game = Game(totalRows, totalCols, numPlayers)
+    gameTrace = []
+    while not game.getReward()[1]:
+        validMoves = game.getValidMoves()
+        move = validMoves[rng.randint(len(validMoves))]
+        analysisProbs = rng.random_sample(totalRows * totalCols) * np.ravel(game.getValidMovesMask())
+        gameTrace.append(SimpleNamespace(selectedAction=move, analysisProbs=analysisProbs / analysisProbs.sum(),
+                                         outcome=rng.choice([-1, 1])))
+        game.makeMove(*move)
+    return gameTrace
+
+def checkResume(totalRows = 5, totalCols = 5, numPlayers = 2, seed = 0):
+    """
+    Writes games, appends a truncated record as an interrupted run would, reopens the writer and writes more games
+    :return: description of the first difference between the games written and the games read back, None if they match
+    """
+    rng = np.random.RandomState(seed)
+    gameTraces = [getRandomGameTrace(totalRows, totalCols, numPlayers, rng) for _ in range(4)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.bin')
+        writer = GameRecordWriter(path, totalRows, totalCols, numPlayers)
+        for gameTrace in gameTraces[:2]:
+            writer.write(gameTrace)
+        record = encodeGame(gameTraces[2], totalRows, totalCols)
+        with open(path, 'ab') as f:
+            f.write(len(record).to_bytes(4, 'little') + record[:len(record) // 2])
+        writer = GameRecordWriter(path, totalRows, totalCols, numPlayers)
+        writer.write(gameTraces[3])
+        games = list(readGames(path))
+
+    expectedTraces = gameTraces[:2] + gameTraces[3:]
+    if(len(games) != len(expectedTraces)):
+        return f'{len(games)} games read back instead of {len(expectedTraces)}'
+    for gameIdx, (game, gameTrace) in enumerate(zip(games, expectedTraces)):
+        if(not np.array_equal(game['moves'], [node.selectedAction for node in gameTrace])):
+            return f'game {gameIdx}: moves differ'
+        if(not np.array_equal(game['outcomes'], [node.outcome for node in gameTrace])):
+            return f'game {gameIdx}: outcomes differ'
+        if(np.abs(game['analysisProbs'] - [node.analysisProbs for node in gameTrace]).max() > 0.02):
+            return f'game {gameIdx}: analysisProbs differ'
+    return None
+
+if __name__=='__main__':
+    difference = checkResume()
+    print(f'resume after a truncated record: {difference if difference is not None else "ok"}')
+    sys.exit(1 if difference is not None else 0)
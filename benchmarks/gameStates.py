@@ -0,0 +1,62 @@
+import time
+import numpy as np
+from env.ChainReaction import Game
+from configs.defaultConfigs import config
+from benchmarks.cellGame import getCellGame
+
+def _getNextState(game, move):
+    return game.getNextState(move)
+
+def _hasFiniteCascades(cellGame):
+    # without the win cutoff of Game, a winning move of the Cell based engine cascades until the recursion limit
+    try:
+        for move in cellGame.getValidMoves():
+            cellGame.getNextState(move)
+    except RecursionError:
+        return False
+    return True
+
+def getRandomPositions(numPositions, maxDepth, seed = 0):
+    """
+    Plays uniformly random moves from a new game and samples positions along the way
+    :return: list of non terminal games with depths spread over [0, maxDepth)
+    """
+    rng = np.random.RandomState(seed)
+    positions = []
+    while len(positions) < numPositions:
+        game = Game(config.totalRows, config.totalCols, config.numPlayers)
+        depth = rng.randint(maxDepth)
+        for _ in range(depth):
+            if game.getReward()[1]:
+                break
+            validMoves = game.getValidMoves()
+            game.makeMove(*validMoves[rng.randint(len(validMoves))])
+        if not game.getReward()[1]:
+            positions.append(game)
+    return positions
+
+def measureChildStates(positions, nextStateFn, repeats = 3):
+    """
+    :return: child states produced per second when expanding every valid move of every position
+    """
+    bestTime = float('inf')
+    numChildren = 0
+    for _ in range(repeats):
+        numChildren = 0
+        t1 = time.perf_counter()
+        for game in positions:
+            for move in game.getValidMoves():
+                nextStateFn(game, move)
+                numChildren += 1
+        bestTime = min(bestTime, time.perf_counter() - t1)
+    return numChildren / bestTime
+
+if __name__=='__main__':
+    positions = [(game, getCellGame(game)) for game in getRandomPositions(200, 60)]
+    positions = [(game, cellGame) for game, cellGame in positions if _hasFiniteCascades(cellGame)]
+    deepcopyRate = measureChildStates([cellGame for _, cellGame in positions], _getNextState)
+    cloneRate = measureChildStates([game for game, _ in positions], _getNextState)
+    print(f'{len(positions)} positions')
+    print(f'Cell based deepcopy getNextState: {deepcopyRate:.0f} child states/s')
+    print(f'clone getNextState: {cloneRate:.0f} child states/s')
+    print(f'speedup: {cloneRate/deepcopyRate:.1f}x')
@@ -0,0 +1,75 @@
+import copy
+import time
+import numpy as np
+from models.ResnetFeatures import getIntuitionPolicy
+from models.inference import InferenceModel
+from utils.misc import transform
+from benchmarks.gameStates import getRandomPositions
+
+BATCH_SIZES = (1, 8, 64, 256)
+PRECISIONS = ('float32', 'float16', 'int8')
+
+def _roundKernel(kernel, precision):
+    """
+    Rounds kernel to the given precision and back to float32. int8 uses one symmetric scale per output channel
+    """
+    if(precision == 'float32'):
+        return kernel
+    if(precision == 'float16'):
+        return kernel.astype(np.float16).astype(np.float32)
+    if(precision == 'int8'):
+        scale = np.abs(kernel).reshape(-1, kernel.shape[-1]).max(axis=0) / 127.
+        scale[scale == 0] = 1.
+        return (np.clip(np.round(kernel / scale), -127, 127) * scale).astype(np.float32)
+    raise ValueError(f'Unknown precision: {precision}')
+
+def getRoundedModel(inferenceModel, precision):
+    """
+    :return: copy of inferenceModel with every kernel rounded to precision. Compute still runs in float32, so this only
+    measures how much accuracy weights stored at that precision would cost, not how fast they would run
+    """
+    roundLayer = lambda layer: (_roundKernel(layer[0], precision), layer[1])
+    roundedModel = copy.copy(inferenceModel)
+    roundedModel.resnetBlocks = [(roundLayer(conv2a), roundLayer(conv2b)) for conv2a, conv2b in inferenceModel.resnetBlocks]
+    for name in ('conv', 'convPolicy', 'fcPolicy', 'convValue', 'fcValue1', 'fcValue2'):
+        setattr(roundedModel, name, roundLayer(getattr(inferenceModel, name)))
+    return roundedModel
+
+def measureLatency(policy, inputs, repeats = 20):
+    """
+    :return: median seconds per call of policy on inputs, after one warm up call
+    """
+    policy(inputs)
+    times = []
+    for _ in range(repeats):
+        t1 = time.perf_counter()
+        policy(inputs)
+        times.append(time.perf_counter() - t1)
+    return float(np.median(times))
+
+def measureAccuracy(referencePolicy, policy, inputs):
+    """
+    :return: (max abs difference of the action probs, max abs difference of the values, top move agreement)
+    """
+    referenceProbs, referenceValues, _ = referencePolicy(inputs)
+    probs, values, _ = policy(inputs)
+    referenceProbs = np.asarray(referenceProbs)
+    referenceValues = np.reshape(np.asarray(referenceValues), -1)
+    return (float(np.abs(probs - referenceProbs).max()), float(np.abs(values - referenceValues).max()),
+            float(np.mean(probs.argmax(axis=1) == referenceProbs.argmax(axis=1))))
+
+if __name__=='__main__':
+    intuitionPolicy = getIntuitionPolicy()
+    inferenceModel = InferenceModel(intuitionPolicy)
+    allInputs = np.stack([transform(game) for game in getRandomPositions(max(BATCH_SIZES), 60)]).astype(np.float32)
+
+    for precision in PRECISIONS:
+        probsError, valuesError, agreement = measureAccuracy(intuitionPolicy, getRoundedModel(inferenceModel, precision),
+                                                             allInputs)
+        print(f'{precision} weights: max probs error {probsError:.2e} | max value error {valuesError:.2e} | top move agreement {agreement:.3f}')
+
+    for batchSize in BATCH_SIZES:
+        inputs = allInputs[:batchSize]
+        eagerLatency = measureLatency(intuitionPolicy, inputs)
+        latency = measureLatency(inferenceModel, inputs)
+        print(f'batch {batchSize:4d}: eager {eagerLatency*1000:8.2f}ms | numpy {latency*1000:8.2f}ms ({eagerLatency/latency:.1f}x)')
@@ -0,0 +1,265 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from functools import lru_cache
+import numpy as np
+from configs.defaultConfigs import config
+from env.ChainReaction import getGameFromPlanes
+from algo.MCTS import SearchTree, TreeNode, playGame
+from algo.parallelSelfPlay import applyConfigValues
+from models.inference import InferenceModel
+from utils.buffer import Buffer
+from utils.misc import transform
+from benchmarks.gameStates import getRandomPositions
+
+SEED = 0
+TINY_CONFIG = {'totalRows': 5, 'totalCols': 5, 'numPlayers': 2, 'numResnetBlocks': 2, 'filters': 16,
+               'simulationsPerMove': 64, 'searchBatchSize': 8, 'virtualLoss': 1, 'searchTimeBudget': None,
+               'earlyStopping': False, 'useTranspositionTable': True, 'symmetryEvaluation': None,
+               'useInferenceModel': False, 'tablebaseDir': None, 'augmentSymmetries': True}
+
+_COLD_START = "import sys, time; t1 = time.perf_counter(); import {module}; print(time.perf_counter() - t1, 'tensorflow' in sys.modules)"
+
+def _getIntuitionPolicy():
+    import tensorflow as tf
+    from models.ResnetFeatures import getIntuitionPolicy
+    tf.random.set_seed(SEED)
+    return getIntuitionPolicy()
+
+def getWorstCascadePosition():
+    """
+    :return: position where the move at (0, 0) of player 0 sets off every cell of the board. Player 0 fills the board
+    one orb short of capacity except for a single orb of player 1 in the opposite corner, so the cascade only stops once
+    it has reached that corner
+    """
+    totalRows, totalCols = config.totalRows, config.totalCols
+    planes = np.zeros((totalRows, totalCols, 2), dtype=np.uint8)
+    for i in range(totalRows):
+        for j in range(totalCols):
+            planes[i, j, 0] = (i > 0 and i < totalRows - 1) + (j > 0 and j < totalCols - 1) + 1
+    planes[totalRows - 1, totalCols - 1] = (0, 1)
+    # the orb total is the number of moves played, it has to be even for player 0 to move
+    if(planes.sum() % 2 == 1):
+        planes[totalRows // 2, totalCols // 2, 0] -= 1
+    return getGameFromPlanes(planes)
+
+def _benchmarkColdStart(module):
+    """
+    Imports module in fresh interpreters, only the import itself is timed
+    """
+    seconds = 0.
+    for _ in range(5):
+        output = subprocess.run([sys.executable, '-c', _COLD_START.format(module=module)], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.split()
+        seconds += float(output[0])
+        if(output[1] == 'True'):
+            print(f'Warning: importing {module} imported tensorflow')
+    return seconds, 5
+
+def _benchmarkMakeMove(positions):
+    games = [(game.clone(), move) for game in positions for move in game.getValidMoves()]
+    t1 = time.perf_counter()
+    for game, move in games:
+        game.makeMove(move[0], move[1])
+    return time.perf_counter() - t1, len(games)
+
+def _benchmarkWorstCascade():
+    worstCascade = getWorstCascadePosition()
+    games = [worstCascade.clone() for _ in range(200)]
+    t1 = time.perf_counter()
+    for game in games:
+        game.makeMove(0, 0)
+    return time.perf_counter() - t1, len(games)
+
+def _benchmarkGetNextState(positions):
+    numChildren = 0
+    t1 = time.perf_counter()
+    for game in positions:
+        for move in game.getValidMoves():
+            game.getNextState(move)
+            numChildren += 1
+    return time.perf_counter() - t1, numChildren
+
+def _benchmarkGetValidMoves(positions):
+    # valid moves are cached per position, so every call is made on a child that was never asked
+    children = [game.getNextState(move) for game in positions for move in game.getValidMoves()[:4]]
+    t1 = time.perf_counter()
+    for game in children:
+        game.getValidMoves()
+    return time.perf_counter() - t1, len(children)
+
+def _benchmarkGetReward(positions):
+    t1 = time.perf_counter()
+    for _ in range(20):
+        for game in positions:
+            game.getReward()
+    return time.perf_counter() - t1, 20 * len(positions)
+
+def _benchmarkTransform(positions):
+    t1 = time.perf_counter()
+    for game in positions:
+        transform(game)
+    return time.perf_counter() - t1, len(positions)
+
+def _getSearchedTree(evaluator):
+    searchTree = SearchTree(TreeNode(getRandomPositions(1, 10, SEED)[0]), evaluator)
+    searchTree.searchMove(maxSimulations=256)
+    return searchTree
+
+def _benchmarkSelect(evaluator):
+    searchTree = _getSearchedTree(evaluator)
+    t1 = time.perf_counter()
+    for _ in range(1000):
+        leaf, path = searchTree.select(searchTree.root)
+        searchTree.backup(path, None)
+    return time.perf_counter() - t1, 1000
+
+def _benchmarkExpand(evaluator, positions):
+    searchTree = SearchTree(TreeNode(positions[0]), evaluator)
+    batches = [[TreeNode(game) for game in positions[i: i + config.searchBatchSize]]
+               for i in range(0, len(positions), config.searchBatchSize)]
+    t1 = time.perf_counter()
+    for leaves in batches:
+        searchTree.expand(leaves)
+    return time.perf_counter() - t1, len(positions)
+
+def _benchmarkSearchMove(evaluator, positions):
+    t1 = time.perf_counter()
+    for game in positions[:10]:
+        SearchTree(TreeNode(game.clone()), evaluator).searchMove()
+    return time.perf_counter() - t1, 10
+
+def _benchmarkSelfPlay(evaluator):
+    t1 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(2):
+            playGame(evaluator)
+    return time.perf_counter() - t1, 2
+
+def _benchmarkAddData(gameTraces):
+    buf = Buffer(config.totalRows, config.totalCols, config.numPlayers, 100000)
+    numPositions = sum(len(gameTrace) for gameTrace in gameTraces)
+    t1 = time.perf_counter()
+    for gameTrace in gameTraces:
+        buf.addData(gameTrace)
+    return time.perf_counter() - t1, numPositions
+
+def _benchmarkTrainEpoch(intuitionPolicy, data):
+    import tensorflow as tf
+    from train.fullTraining import trainLoop
+    # the difference between 3 epochs and 1 removes the dataset set up and tracing from the epoch time
+    times = []
+    for numEpochs in (1, 3):
+        tf.random.set_seed(SEED)
+        t1 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            trainLoop(intuitionPolicy, *data, numEpochs=numEpochs)
+        times.append(time.perf_counter() - t1)
+    return max(times[1] - times[0], 1e-9) / 2, len(data[0])
+
+def runBenchmarks(names = None, repeats = 3):
+    """
+    Runs every benchmark, or those in names, with TINY_CONFIG and fixed seeds. The network is only built, and tensorflow
+    only imported, if a benchmark that needs it is run
+    :return: dict mapping benchmark names to {'seconds': best seconds per unit, 'unit': what one unit is}
+    """
+    applyConfigValues(TINY_CONFIG)
+    np.random.seed(SEED)
+    positions = getRandomPositions(200, 60, SEED)
+
+    @lru_cache(maxsize=None)
+    def getIntuitionPolicy():
+        return _getIntuitionPolicy()
+
+    @lru_cache(maxsize=None)
+    def getEvaluator():
+        return InferenceModel(getIntuitionPolicy())
+
+    @lru_cache(maxsize=None)
+    def getGameTraces():
+        np.random.seed(SEED)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [playGame(getEvaluator()) for _ in range(4)]
+
+    @lru_cache(maxsize=None)
+    def getTrainingData():
+        buf = Buffer(config.totalRows, config.totalCols, config.numPlayers, 100000)
+        for gameTrace in getGameTraces():
+            buf.addData(gameTrace)
+        return buf.sample(2048, np.random.RandomState(SEED))
+
+    # fixtures are built before the measured part of a run starts
+    benchmarks = [
+        ('coldStartEnv', 'import', lambda: _benchmarkColdStart('env.ChainReaction')),
+        ('coldStartSearch', 'import', lambda: _benchmarkColdStart('algo.MCTS')),
+        ('makeMove', 'move', lambda: _benchmarkMakeMove(positions)),
+        ('makeMoveWorstCascade', 'move', lambda: _benchmarkWorstCascade()),
+        ('getNextState', 'child state', lambda: _benchmarkGetNextState(positions)),
+        ('getValidMoves', 'call', lambda: _benchmarkGetValidMoves(positions)),
+        ('getReward', 'call', lambda: _benchmarkGetReward(positions)),
+        ('transform', 'position', lambda: _benchmarkTransform(positions)),
+        ('select', 'descent', lambda: _benchmarkSelect(getEvaluator())),
+        ('expand', 'leaf', lambda: _benchmarkExpand(getEvaluator(), positions)),
+        ('searchMove', 'move', lambda: _benchmarkSearchMove(getEvaluator(), positions)),
+        ('selfPlayGame', 'game', lambda: _benchmarkSelfPlay(getEvaluator())),
+        ('bufferAddData', 'position', lambda: _benchmarkAddData(getGameTraces())),
+        ('trainEpoch', 'example', lambda: _benchmarkTrainEpoch(getIntuitionPolicy(), getTrainingData())),
+    ]
+
+    results = {}
+    for name, unit, run in benchmarks:
+        if(names is not None and name not in names):
+            continue
+        bestTime = float('inf')
+        for _ in range(repeats):
+            np.random.seed(SEED)
+            seconds, numUnits = run()
+            bestTime = min(bestTime, seconds / numUnits)
+        results[name] = {'seconds': bestTime, 'unit': unit}
+        print(f'{name:>22}: {bestTime*1e6:12.2f}us per {unit}')
+    return results
+
+def compareResults(results, baseline, tolerance):
+    """
+    :return: list of (name, baselineSeconds, seconds) of the benchmarks more than tolerance slower than the baseline
+    """
+    regressions = []
+    for name, result in results.items():
+        if(name not in baseline):
+            continue
+        baselineSeconds = baseline[name]['seconds']
+        ratio = result['seconds'] / baselineSeconds
+        print(f'{name:>22}: {ratio:6.2f}x baseline{" REGRESSION" if ratio > 1 + tolerance else ""}')
+        if(ratio > 1 + tolerance):
+            regressions.append((name, baselineSeconds, result['seconds']))
+    return regressions
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Times the engine, search and training hot paths with a tiny model')
+    parser.add_argument('--output', default='benchmarks/results.json')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown relative to the baseline that fails the run')
+    parser.add_argument('--only', help='comma separated benchmark names')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.only.split(',') if args.only else None, args.repeats)
+    with open(args.output, 'w') as f:
+        json.dump({'config': TINY_CONFIG, 'seed': SEED, 'python': platform.python_version(), 'numpy': np.__version__,
+                   'tensorflow': sys.modules['tensorflow'].__version__ if 'tensorflow' in sys.modules else None, 'machine': platform.machine(), 'results': results}, f, indent=1)
+
+    if(args.baseline is not None):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if(baseline['config'] != TINY_CONFIG):
+            print('Warning: the baseline was run with a different config')
+        regressions = compareResults(results, baseline['results'], args.tolerance)
+        if(len(regressions) > 0):
+            print(f'{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}')
+            sys.exit(1)
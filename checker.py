@@ -1,6 +1,5 @@
-from env.ChainReaction import Cell, Game
+from env.ChainReaction import Game
 import numpy as np
-import sys
 env = Game(3,3)
 env.makeMove(0, 0)
 nextEnv = env.getNextState(move = (1, 1))
@@ -16,4 +15,4 @@ print(idx2)
 mask[idx2] = 1
 print(mask)
 
-print(sys.getrecursionlimit())
\ No newline at end of file
+print(env.lastCascadeLength)
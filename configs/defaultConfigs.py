@@ -6,6 +6,40 @@ class config(object):
     totalLearningIterations = 512
     cUB = 1.0
     simulationsPerMove = 100
+    searchBatchSize = 8
+    virtualLoss = 1
+    searchTimeBudget = None # seconds per move, None only limits the number of simulations
+    earlyStopping = True # stop a search once the most visited root move can no longer be overtaken
+    evaluationCacheSize = 200000
+    useTranspositionTable = True
+    tablebaseDir = None # directory of the exact endgame tablebase used by the search, None disables it
+    tablebaseMaxMoves = 6 # leaves that end within this many moves whatever is played are solved during the search
+    tablebaseMaxNodes = 20000 # positions a single solve during the search may visit before it gives up
+    numSelfPlayWorkers = 0 # 0 plays all games in the training process
+    inferenceMaxBatchSize = 256
+    inferenceMaxWait = 0.002 # seconds the inference server waits for more requests before running a partial batch
+    replayBufferSize = 1000000
+    replayBufferDir = None # keeps the replay buffer in RAM, set a path to memory map it on disk
+    replayShardSize = 65536
+    gameRecordDir = None # directory finished self-play games are appended to in compressed form, None disables it
+    samplesPerTraining = 131072
+    numActors = 2 # self-play processes of the asynchronous pipeline in train.asyncTraining
+    minReplaySize = 10000 # positions in the replay buffer before the learner starts training
+    checkpointDir = 'checkpoints'
+    serverMaxSessions = 1000 # games serve.moveServer keeps open at once
+    serverMaxConcurrentMoves = 8 # moves searched at the same time by the move server
+    serverMaxQueuedMoves = 64 # moves waiting for a search thread before new ones are rejected
+    serverMoveLatency = 1.0 # seconds from a move request to its answer, the search gets what is left after waiting
+    serverSessionTimeout = 600 # seconds a session may stay idle before it is evicted
+    arenaGames = 200 # games per train.arena match
+    arenaOpeningMoves = 4 # arena moves sampled with initialTemperature, finalTemperature afterwards
+    numRollouts = 1 # random games per leaf evaluated by the rollout baseline
+    augmentSymmetries = True
+    symmetryEvaluation = None # None, 'random' or 'average' over all board symmetries when evaluating MCTS leaves
+    instrumentationSampleRate = 0. # fraction of self-play moves whose search is timed and reported, 0 turns it off
+    instrumentationLog = None # json lines file instrumentation records are appended to, None only prints them
+    printBoards = True # printed moves show the board they were searched from
+    useInferenceModel = False # self-play, the arena and the move server evaluate leaves with the numpy models.inference.InferenceModel instead of the Keras model
     initialTemperature = 1
     finalTemperature = 0.01
     l2Weight = 0.0001
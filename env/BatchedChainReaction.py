@@ -0,0 +1,152 @@
+import numpy as np
+from env.ChainReaction import Game, _getCapacities, getGameFromPlanes
+
+class BatchedChainReaction(object):
+    """
+    batchSize Chain Reaction boards stepped together with numpy. orbs and owners are (batchSize, totalRows, totalCols)
+    arrays with the same meaning as in Game: owners is meaningless where orbs is 0.
+    makeMoves resolves the cascades of all boards at once, wave by wave exactly like Game: every cell at capacity at the
+    start of a wave explodes, then the orbs are distributed, and a board stops as soon as its mover owns every orb once
+    all opponents have moved.
+    """
+    def __init__(self, batchSize, totalRows = 5, totalCols = 5, numPlayers = 2):
+        self.batchSize = batchSize
+        self.totalRows = totalRows
+        self.totalCols = totalCols
+        self.numPlayers = numPlayers
+        self.capacity = np.frombuffer(_getCapacities(totalRows, totalCols), dtype=np.uint8).reshape(totalRows, totalCols).astype(np.int16)
+        self.orbs = np.zeros((batchSize, totalRows, totalCols), dtype=np.int16)
+        self.owners = np.zeros((batchSize, totalRows, totalCols), dtype=np.int16)
+        self.curPlayer = np.zeros(batchSize, dtype=np.int64)
+        self.totalMoves = np.zeros(batchSize, dtype=np.int64)
+        self.lastCascadeLength = np.zeros(batchSize, dtype=np.int64)
+
+    @classmethod
+    def fromPlanes(cls, planes):
+        """
+        :param planes: (batchSize, totalRows, totalCols, numPlayers) orbs of every player, as returned by getPlanes()
+        """
+        batchSize, totalRows, totalCols, numPlayers = planes.shape
+        boards = cls(batchSize, totalRows, totalCols, numPlayers)
+        boards.orbs[:] = planes.sum(axis=3)
+        boards.owners[:] = planes.argmax(axis=3)
+        # explosions never create or destroy orbs, so the orb total is the number of moves played
+        boards.totalMoves[:] = boards.orbs.sum(axis=(1, 2))
+        boards.curPlayer[:] = boards.totalMoves % numPlayers
+        return boards
+
+    @classmethod
+    def fromFeatures(cls, features):
+        """
+        :param features: (batchSize, totalRows, totalCols, numPlayers) images made by utils.misc.transform or getFeatures()
+        """
+        numPlayers = features.shape[3]
+        curPlayer = np.asarray(features.sum(axis=(1, 2, 3)), dtype=np.int64) % numPlayers
+        playerIdxs = (np.arange(numPlayers)[None, :] + curPlayer[:, None]) % numPlayers
+        return cls.fromPlanes(np.take_along_axis(features, playerIdxs[:, None, None, :], axis=3).astype(np.int16))
+
+    @classmethod
+    def fromGames(cls, games):
+        return cls.fromPlanes(np.stack([game.getPlanes() for game in games]))
+
+    def getGame(self, boardIdx) -> Game:
+        return getGameFromPlanes(self.getPlanes()[boardIdx])
+
+    def getPlanes(self):
+        """
+        :return: (batchSize, totalRows, totalCols, numPlayers) orbs of every player in its own plane, like Game.getPlanes
+        """
+        playerIdxs = np.arange(self.numPlayers, dtype=np.int16)
+        return np.where(self.owners[..., None] == playerIdxs, self.orbs[..., None], 0)
+
+    def getFeatures(self, dtype = float):
+        """
+        :return: utils.misc.transform of every board, the player to move first
+        """
+        playerIdxs = (np.arange(self.numPlayers)[None, :] - self.curPlayer[:, None]) % self.numPlayers
+        return np.take_along_axis(self.getPlanes(), playerIdxs[:, None, None, :], axis=3).astype(dtype)
+
+    def getValidMovesMask(self):
+        """
+        :return: (batchSize, totalRows, totalCols) bool array, True where the player to move on that board may move
+        """
+        return (self.orbs == 0) | (self.owners == self.curPlayer[:, None, None])
+
+    def getOrbTotals(self):
+        """
+        :return: (batchSize, numPlayers) orbs of every player
+        """
+        return self.getPlanes().sum(axis=(1, 2), dtype=np.int64)
+
+    def getTerminal(self):
+        """
+        :return: (batchSize,) bool array, True where the player to move has lost, as Game.getReward
+        """
+        curPlayerOwnsAny = ((self.orbs > 0) & (self.owners == self.curPlayer[:, None, None])).any(axis=(1, 2))
+        return (self.totalMoves > self.curPlayer) & ~curPlayerOwnsAny
+
+    def getRandomMoves(self, rng = np.random):
+        """
+        :return: (batchSize,) flattened valid moves drawn uniformly on every board
+        """
+        keys = rng.random_sample((self.batchSize, self.totalRows * self.totalCols))
+        keys[~self.getValidMovesMask().reshape(self.batchSize, -1)] = -1
+        return keys.argmax(axis=1)
+
+    def makeMoves(self, moves):
+        """
+        :param moves: (batchSize,) flattened cells the player to move puts an orb in, boards with a negative move are left
+        as they are
+        :return: (batchSize,) number of explosions on every board, also stored in lastCascadeLength
+        """
+        moves = np.asarray(moves)
+        moved = moves >= 0
+        boardIdxs = np.flatnonzero(moved)
+        rows, cols = moves[boardIdxs] // self.totalCols, moves[boardIdxs] % self.totalCols
+        movers = self.curPlayer[boardIdxs]
+        occupied = self.orbs[boardIdxs, rows, cols] != 0
+        if(np.any(occupied & (self.owners[boardIdxs, rows, cols] != movers))):
+            raise PermissionError('Invalid move: the cell belongs to another player')
+
+        self.lastCascadeLength[:] = 0
+        self.orbs[boardIdxs, rows, cols] += 1
+        self.owners[boardIdxs, rows, cols] = movers
+        exploding = self.orbs[boardIdxs, rows, cols] >= self.capacity[rows, cols]
+        # cascading boards are copied out and only written back once their cascade is over
+        boardIdxs, rows, cols = boardIdxs[exploding], rows[exploding], cols[exploding]
+        orbs, owners = self.orbs[boardIdxs], self.owners[boardIdxs]
+        movers = self.curPlayer[boardIdxs, None, None].astype(np.int16)
+        wave = np.zeros(orbs.shape, dtype=bool)
+        wave[np.arange(len(boardIdxs)), rows, cols] = True
+        # the cutoff only applies once every opponent has had a chance to put an orb on the board
+        checkWin = self.totalMoves[boardIdxs] >= self.numPlayers - 1
+        cascadeLengths = np.zeros(len(boardIdxs), dtype=np.int64)
+
+        while len(boardIdxs) > 0:
+            moverOwnsAll = ~((orbs > 0) & (owners != movers)).any(axis=(1, 2))
+            done = ~wave.any(axis=(1, 2)) | (checkWin & moverOwnsAll)
+            if(done.any()):
+                self.orbs[boardIdxs[done]] = orbs[done]
+                self.owners[boardIdxs[done]] = owners[done]
+                self.lastCascadeLength[boardIdxs[done]] = cascadeLengths[done]
+                running = ~done
+                boardIdxs, orbs, owners, movers = boardIdxs[running], orbs[running], owners[running], movers[running]
+                wave, checkWin, cascadeLengths = wave[running], checkWin[running], cascadeLengths[running]
+                if(len(boardIdxs) == 0):
+                    break
+            np.subtract(orbs, self.capacity, out=orbs, where=wave)
+            cascadeLengths += np.count_nonzero(wave, axis=(1, 2))
+            received = np.zeros(orbs.shape, dtype=np.int16)
+            received[:, 1:, :] += wave[:, :-1, :]
+            received[:, :-1, :] += wave[:, 1:, :]
+            received[:, :, 1:] += wave[:, :, :-1]
+            received[:, :, :-1] += wave[:, :, 1:]
+            # a cell explodes in the next wave if its count passes through its capacity
+            wave = orbs < self.capacity
+            orbs += received
+            wave &= orbs >= self.capacity
+            np.copyto(owners, movers, where=received > 0)
+
+        self.totalMoves[moved] += 1
+        self.curPlayer[moved] = self.totalMoves[moved] % self.numPlayers
+        return self.lastCascadeLength.copy()
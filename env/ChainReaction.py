@@ -1,82 +1,231 @@
-from texttable import Texttable
-import copy
+from functools import lru_cache
+import numpy as np
 from configs.defaultConfigs import config
-class Cell(object):
-    def __init__(self, row, col, totalRows = 5, totalCols = 5):
-        self.isEmpty = True
-        self.playerIdx = -1
-        self.numOrbs = 0
-        self.row = row
-        self.col = col
-        self.maxCapacity = self.__getCapacity(row, col, totalRows, totalCols)
-
-    def __getCapacity(self, row, col, totalRows, totalCols):
-        if((row==0 or row==totalRows-1) and (col==0 or col==totalCols-1)):
-            return 2
-        elif(row==0 or row==totalRows-1 or col==0 or col==totalCols-1):
-            return 3
-        else:
-            return 4
 
-    def putOrb(self, playerIdx):
-        self.isEmpty = False
-        self.numOrbs += 1
-        self.playerIdx = playerIdx
+def _getCapacity(row, col, totalRows, totalCols):
+    if((row==0 or row==totalRows-1) and (col==0 or col==totalCols-1)):
+        return 2
+    elif(row==0 or row==totalRows-1 or col==0 or col==totalCols-1):
+        return 3
+    else:
+        return 4
 
-    def reset(self):
-        self.isEmpty = True
-        self.numOrbs = 0
-        self.playerIdx = -1
+@lru_cache(maxsize=None)
+def _getNeighbors(totalRows, totalCols):
+    """
+    :return: tuple indexed by flat cell index holding the flat indices of the orthogonal neighbours of that cell
+    """
+    neighbors = []
+    for i in range(totalRows):
+        for j in range(totalCols):
+            cellNeighbors = []
+            for di, dj in ((-1, 0), (0, -1), (1, 0), (0, 1)):
+                ni = i + di
+                nj = j + dj
+                if(ni>=0 and ni<totalRows and nj>=0 and nj<totalCols):
+                    cellNeighbors.append(ni * totalCols + nj)
+            neighbors.append(tuple(cellNeighbors))
+    return tuple(neighbors)
 
-    def getString(self):
-        if(self.isEmpty):
-            return "   "
-        else:
-            return str(self.playerIdx)+":"+str(self.numOrbs)
+@lru_cache(maxsize=None)
+def _getCapacities(totalRows, totalCols):
+    return bytes(_getCapacity(i, j, totalRows, totalCols) for i in range(totalRows) for j in range(totalCols))
+
+# a cell holds at most 2*4-1 orbs, even on boards where the cascade was cut off
+_MAX_ORBS = 8
+
+@lru_cache(maxsize=None)
+def _getZobristKeys(totalRows, totalCols, numPlayers):
+    """
+    :return: (cellKeys, playerKeys). cellKeys[(cellIdx*numPlayers + playerIdx)*_MAX_ORBS + numOrbs] is the 64 bit key
+    of cellIdx holding numOrbs orbs of playerIdx, 0 for an empty cell. playerKeys[playerIdx] marks the player to move
+    """
+    rng = np.random.RandomState(totalRows * 10007 + totalCols * 101 + numPlayers)
+    cellKeys = rng.randint(1, 2**63, size=(totalRows * totalCols, numPlayers, _MAX_ORBS), dtype=np.int64)
+    cellKeys[:, :, 0] = 0
+    playerKeys = rng.randint(1, 2**63, size=numPlayers, dtype=np.int64)
+    return tuple(cellKeys.ravel().tolist()), tuple(playerKeys.tolist())
 
 class Game(object):
+    """
+    Chain Reaction board. Cells are stored row major in flat bytearrays: orbs holds the orb count of every cell and
+    owners the index of the player owning it. A cell is empty iff its orb count is 0, owners is meaningless for empty cells.
+    Board-shape dependent tables (capacity, neighbors) are shared between all games of the same shape.
+
+    Everything derived from the board is kept up to date as orbs move instead of being recomputed by scanning it:
+    orbTotals (orbs per player), emptyCells, validMasks (player major, 1 where that player may put an orb) and
+    planes ((cell, player) major, orb count of cell if owned by player else 0).
+    hash is the Zobrist hash of the board and the player to move.
+    """
     def __init__(self, totalRows = 5, totalCols = 5, numPlayers = 2):
         self.totalRows = totalRows
         self.totalCols = totalCols
         self.numPlayers = numPlayers
-        self.grid = [[Cell(i, j, self.totalRows, self.totalCols) for j in range(self.totalCols)] for i in range(self.totalRows)]
-        self.di = [-1, 0, 1, 0]
-        self.dj = [0, -1, 0, 1]
+        totalCells = totalRows * totalCols
+        self.capacity = _getCapacities(totalRows, totalCols)
+        self.neighbors = _getNeighbors(totalRows, totalCols)
+        self.cellKeys, self.playerKeys = _getZobristKeys(totalRows, totalCols, numPlayers)
+        self.orbs = bytearray(totalCells)
+        self.owners = bytearray(totalCells)
+        self.planes = bytearray(totalCells * numPlayers)
+        self.validMasks = bytearray(b'\x01' * (numPlayers * totalCells))
+        self.orbTotals = [0] * numPlayers
+        self.emptyCells = totalCells
         self.curPlayer = 0
         self.totalMoves = 0
+        self.lastCascadeLength = 0
+        self.hash = self.playerKeys[0]
         self.validMoves = []
         self.validMovesForMove = -1
 
+    def clone(self):
+        """
+        :return: an independent copy of this game. Only the per-cell buffers are copied, shared tables are referenced
+        """
+        newGame = Game.__new__(Game)
+        newGame.__dict__.update(self.__dict__)
+        newGame.orbs = bytearray(self.orbs)
+        newGame.owners = bytearray(self.owners)
+        newGame.planes = bytearray(self.planes)
+        newGame.validMasks = bytearray(self.validMasks)
+        newGame.orbTotals = list(self.orbTotals)
+        return newGame
+
+    def isEmpty(self, row, col):
+        return self.orbs[row * self.totalCols + col] == 0
+
+    def _view(self, buffer, shape):
+        view = np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+        view.flags.writeable = False
+        return view
+
+    def getOrbs(self):
+        """
+        :return: read only (totalRows, totalCols) uint8 view of the orb counts
+        """
+        return self._view(self.orbs, (self.totalRows, self.totalCols))
+
+    def getOwners(self):
+        """
+        :return: read only (totalRows, totalCols) uint8 view of the cell owners. Only meaningful where getOrbs() is non zero
+        """
+        return self._view(self.owners, (self.totalRows, self.totalCols))
+
+    def getPlanes(self):
+        """
+        :return: read only (totalRows, totalCols, numPlayers) uint8 view holding the orbs of every player in its own plane
+        """
+        return self._view(self.planes, (self.totalRows, self.totalCols, self.numPlayers))
+
+    def getValidMovesMask(self):
+        """
+        :return: read only (totalRows, totalCols) uint8 view, 1 where curPlayer is allowed to move
+        """
+        return self._view(self.validMasks, (self.numPlayers, self.totalRows, self.totalCols))[self.curPlayer]
+
     def makeMove(self, row, col):
-        if(not(self.grid[row][col].isEmpty) and self.grid[row][col].playerIdx != self.curPlayer):
-            raise PermissionError(f'Invalid move. curPlayer: {self.curPlayer} | occupied by: {self.grid[row][col].playerIdx}')
-        self._putOrb(self.curPlayer, row, col)
+        """
+        :return: number of explosions triggered by the move, also stored in lastCascadeLength
+        """
+        cellIdx = row * self.totalCols + col
+        if(self.orbs[cellIdx] != 0 and self.owners[cellIdx] != self.curPlayer):
+            raise PermissionError(f'Invalid move. curPlayer: {self.curPlayer} | occupied by: {self.owners[cellIdx]}')
+        self.lastCascadeLength = self._putOrb(self.curPlayer, cellIdx)
         self.totalMoves += 1
+        self.hash ^= self.playerKeys[self.curPlayer]
         self.curPlayer = self.totalMoves % self.numPlayers
+        self.hash ^= self.playerKeys[self.curPlayer]
+        return self.lastCascadeLength
 
-    def _putOrb(self, playerIdx, row, col):
-        curCell = self.grid[row][col]
-        curCell.putOrb(playerIdx)
-        self._explode(curCell, playerIdx)
-
-    def _explode(self, cell, playerIdx):
-        if(cell.numOrbs==cell.maxCapacity):
-            i = cell.row
-            j = cell.col
-            di = self.di
-            dj = self.dj
-            totalRows = self.totalRows
-            totalCols = self.totalCols
-            cell.reset()
-            for k in range(4):
-                ni = i + di[k]
-                nj = j + dj[k]
-                if(ni>=0 and ni<totalRows and nj>=0 and nj<totalCols):
-                    self._putOrb(playerIdx, ni, nj)
+    def _addOrb(self, playerIdx, cellIdx):
+        """
+        Adds one orb of playerIdx to cellIdx, capturing the orbs already there
+        :return: the new orb count of the cell
+        """
+        orbs = self.orbs
+        numOrbs = orbs[cellIdx]
+        numPlayers = self.numPlayers
+        totalCells = len(orbs)
+        prevOwner = self.owners[cellIdx]
+        self.hash ^= self.cellKeys[(cellIdx * numPlayers + prevOwner) * _MAX_ORBS + numOrbs] ^ \
+                     self.cellKeys[(cellIdx * numPlayers + playerIdx) * _MAX_ORBS + numOrbs + 1]
+        if(numOrbs==0):
+            self.emptyCells -= 1
+            validMasks = self.validMasks
+            for otherIdx in range(cellIdx, numPlayers * totalCells, totalCells):
+                validMasks[otherIdx] = 0
+            validMasks[playerIdx * totalCells + cellIdx] = 1
+        elif(prevOwner != playerIdx):
+            self.orbTotals[prevOwner] -= numOrbs
+            self.orbTotals[playerIdx] += numOrbs
+            self.planes[cellIdx * numPlayers + prevOwner] = 0
+            self.validMasks[prevOwner * totalCells + cellIdx] = 0
+            self.validMasks[playerIdx * totalCells + cellIdx] = 1
+        numOrbs += 1
+        orbs[cellIdx] = numOrbs
+        self.owners[cellIdx] = playerIdx
+        self.planes[cellIdx * numPlayers + playerIdx] = numOrbs
+        self.orbTotals[playerIdx] += 1
+        return numOrbs
+
+    def _removeOrbs(self, cellIdx, numRemoved):
+        orbs = self.orbs
+        playerIdx = self.owners[cellIdx]
+        numOrbs = orbs[cellIdx] - numRemoved
+        keyIdx = (cellIdx * self.numPlayers + playerIdx) * _MAX_ORBS
+        self.hash ^= self.cellKeys[keyIdx + orbs[cellIdx]] ^ self.cellKeys[keyIdx + numOrbs]
+        orbs[cellIdx] = numOrbs
+        self.planes[cellIdx * self.numPlayers + playerIdx] = numOrbs
+        self.orbTotals[playerIdx] -= numRemoved
+        if(numOrbs==0):
+            self.emptyCells += 1
+            totalCells = len(orbs)
+            validMasks = self.validMasks
+            for otherIdx in range(cellIdx, self.numPlayers * totalCells, totalCells):
+                validMasks[otherIdx] = 1
+
+    def _putOrb(self, playerIdx, cellIdx):
+        """
+        Puts an orb of playerIdx in cellIdx and resolves the resulting chain reaction wave by wave: every cell that is at
+        capacity at the start of a wave explodes, then all of their orbs are distributed. Capacity equals the number of
+        neighbours, so a cell never holds twice its capacity and is queued at most once per wave.
+        The cascade stops as soon as playerIdx owns every orb on the board since the game is decided at that point.
+        :return: number of explosions
+        """
+        capacity = self.capacity
+        neighbors = self.neighbors
+        orbTotals = self.orbTotals
+        if(self._addOrb(playerIdx, cellIdx) < capacity[cellIdx]):
+            return 0
+
+        # the cutoff only applies once every opponent has had a chance to put an orb on the board
+        checkWin = self.totalMoves >= self.numPlayers - 1
+        cascadeLength = 0
+        wave = [cellIdx]
+        while wave:
+            if(checkWin and orbTotals[playerIdx] == sum(orbTotals)):
+                break
+            for explodingIdx in wave:
+                self._removeOrbs(explodingIdx, capacity[explodingIdx])
+            cascadeLength += len(wave)
+            nextWave = []
+            for explodingIdx in wave:
+                for neighborIdx in neighbors[explodingIdx]:
+                    if(self._addOrb(playerIdx, neighborIdx) == capacity[neighborIdx]):
+                        nextWave.append(neighborIdx)
+            wave = nextWave
+        return cascadeLength
+
+    def _getCellString(self, cellIdx):
+        if(self.orbs[cellIdx]==0):
+            return "   "
+        else:
+            return str(self.owners[cellIdx])+":"+str(self.orbs[cellIdx])
 
     def printGrid(self):
+        from texttable import Texttable
         table = Texttable()
-        sg = [[self.grid[i][j].getString() for j in range(self.totalCols)] for i in range(self.totalRows)]
+        sg = [[self._getCellString(i * self.totalCols + j) for j in range(self.totalCols)] for i in range(self.totalRows)]
         table.add_rows(sg)
         print(table.draw())
         print("||||||||||||||||||||||||||||||||||")
@@ -84,36 +233,48 @@ class Game(object):
         print()
 
     def getReward(self):
-        cnt = 0
-        for i in range(self.totalRows):
-            for j in range(self.totalCols):
-                curCell = self.grid[i][j]
-                if curCell.isEmpty:
-                    return (0, False)
-                cnt += curCell.numOrbs if curCell.playerIdx==self.curPlayer else 0
-
-        if(cnt==0 and self.totalMoves>self.curPlayer):
+        """
+        A player loses once all of its orbs have been captured, which can only happen after it has moved at least once
+        :return: (reward, isTerminal) from the point of view of curPlayer
+        """
+        if(self.totalMoves>self.curPlayer and self.orbTotals[self.curPlayer]==0):
             return (-1, True)
         else:
             return (0, False)
 
     def getValidMoves(self):
         if(self.totalMoves != self.validMovesForMove):
-            self.validMoves = []
-            for i in range(self.totalRows):
-                for j in range(self.totalCols):
-                    if(self.grid[i][j].isEmpty or self.grid[i][j].playerIdx==self.curPlayer):
-                        self.validMoves.append((i, j))
+            totalCols = self.totalCols
+            flatMoves = np.flatnonzero(self.getValidMovesMask()).tolist()
+            self.validMoves = [(cellIdx // totalCols, cellIdx % totalCols) for cellIdx in flatMoves]
+            self.validMovesForMove = self.totalMoves
         return self.validMoves
 
     def getNextState(self, move = None, row = -1, col = -1):
         assert move!=None or (row>=0 and col>=0)
         if(move is None):
             move = (row, col)
-        newGame = copy.deepcopy(self)
+        newGame = self.clone()
         newGame.makeMove(move[0], move[1])
         return newGame
 
 
 def getNewGame():
-    return Game(config.totalRows, config.totalCols, config.numPlayers)
\ No newline at end of file
+    return Game(config.totalRows, config.totalCols, config.numPlayers)
+
+def getGameFromPlanes(planes):
+    """
+    Rebuilds a game from the (totalRows, totalCols, numPlayers) orb planes returned by Game.getPlanes(). Moves are the only
+    way orbs enter the board and explosions never destroy any, so the orb total is the number of moves played and
+    determines the player to move
+    """
+    totalRows, totalCols, numPlayers = planes.shape
+    game = Game(totalRows, totalCols, numPlayers)
+    flatPlanes = np.asarray(planes, dtype=int).reshape(totalRows * totalCols, numPlayers)
+    for cellIdx, playerIdx in zip(*np.nonzero(flatPlanes)):
+        for _ in range(flatPlanes[cellIdx, playerIdx]):
+            game._addOrb(int(playerIdx), int(cellIdx))
+    game.totalMoves = int(flatPlanes.sum())
+    game.curPlayer = game.totalMoves % numPlayers
+    game.hash ^= game.playerKeys[0] ^ game.playerKeys[game.curPlayer]
+    return game
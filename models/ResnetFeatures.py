@@ -1,5 +1,6 @@
 import tensorflow as tf
 from tensorflow.keras import *
+from configs.defaultConfigs import config
 
 class ResnetBlock(tf.keras.Model):
     def __init__(self, filters, conv_size, l2Weight, name, **kwargs):
@@ -80,6 +81,18 @@ class IntuitionPolicy(tf.keras.Model):
 
         return tf.tuple([actionProbs, values, actionLogitProbs])
 
+def getIntuitionPolicy(weights = None):
+    """
+    Import this module inside the functions that build a network, so that TensorFlow is only loaded where one is needed
+    :return: built IntuitionPolicy of the size set in config, with weights if given
+    """
+    intuitionPolicy = IntuitionPolicy(config.totalRows, config.totalCols, config.numPlayers, config.l2Weight,
+                                      config.numResnetBlocks, config.filters)
+    intuitionPolicy.build(input_shape = (None, config.totalRows, config.totalCols, config.numPlayers))
+    if(weights is not None):
+        intuitionPolicy.set_weights(weights)
+    return intuitionPolicy
+
 if __name__=='__main__':
     intuitionPolicy = IntuitionPolicy(5, 5, 2)
     intuitionPolicy.build(input_shape = (None, 5, 5, 2))
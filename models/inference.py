@@ -0,0 +1,70 @@
+import numpy as np
+from algo.evaluators import Evaluator
+
+def _foldBatchNorm(conv, bn):
+    """
+    :return: (kernel, bias) of a single convolution computing bn(conv(x)) with the moving statistics of bn
+    """
+    scale = bn.gamma.numpy() / np.sqrt(bn.moving_variance.numpy() + bn.epsilon)
+    kernel = conv.kernel.numpy() * scale
+    bias = (conv.bias.numpy() - bn.moving_mean.numpy()) * scale + bn.beta.numpy()
+    return kernel.astype(np.float32), bias.astype(np.float32)
+
+def _getDense(dense):
+    return dense.kernel.numpy().astype(np.float32), dense.bias.numpy().astype(np.float32)
+
+def _conv(x, kernel, bias):
+    """
+    'same' padded convolution of NHWC x as a single matrix product over the im2col patches
+    """
+    numInputs, totalRows, totalCols, channels = x.shape
+    kernelRows, kernelCols, _, filters = kernel.shape
+    if(kernelRows == 1 and kernelCols == 1):
+        patches = x
+    else:
+        padRows, padCols = kernelRows // 2, kernelCols // 2
+        padded = np.pad(x, ((0, 0), (padRows, padRows), (padCols, padCols), (0, 0)))
+        patches = np.concatenate([padded[:, i: i + totalRows, j: j + totalCols, :]
+                                  for i in range(kernelRows) for j in range(kernelCols)], axis=-1)
+    out = patches.reshape(-1, kernelRows * kernelCols * channels) @ kernel.reshape(-1, filters) + bias
+    return out.reshape(numInputs, totalRows, totalCols, filters)
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+class InferenceModel(Evaluator):
+    """
+    Inference only numpy version of an IntuitionPolicy. Batch normalization is folded into the preceding convolutions and
+    the action logits used for training are not returned. Calls return (actionProbs, values, None) like the Keras model.
+    """
+    def __init__(self, intuitionPolicy):
+        self.conv = _foldBatchNorm(intuitionPolicy.conv, intuitionPolicy.bn)
+        self.resnetBlocks = [(_foldBatchNorm(block.conv2a, block.bn2a), _foldBatchNorm(block.conv2b, block.bn2b))
+                             for block in intuitionPolicy.resnetBlocks]
+        self.convPolicy = _foldBatchNorm(intuitionPolicy.convPolicy, intuitionPolicy.bnPolicy)
+        self.fcPolicy = _getDense(intuitionPolicy.fcPolicy)
+        self.convValue = _foldBatchNorm(intuitionPolicy.convValue, intuitionPolicy.bnValue)
+        self.fcValue1 = _getDense(intuitionPolicy.fcValue1)
+        self.fcValue2 = _getDense(intuitionPolicy.fcValue2)
+
+    def __call__(self, input, training = False):
+        x = np.asarray(input, dtype=np.float32)
+        x = _relu(_conv(x, *self.conv))
+
+        for conv2a, conv2b in self.resnetBlocks:
+            y = _relu(_conv(x, *conv2a))
+            y = _conv(y, *conv2b)
+            y += x
+            x = _relu(y)
+
+        policyFeatures = _relu(_conv(x, *self.convPolicy)).reshape(len(x), -1)
+        actionLogitProbs = policyFeatures @ self.fcPolicy[0] + self.fcPolicy[1]
+        actionLogitProbs -= actionLogitProbs.max(axis=1, keepdims=True)
+        actionProbs = np.exp(actionLogitProbs)
+        actionProbs /= actionProbs.sum(axis=1, keepdims=True)
+
+        valueFeatures = _conv(x, *self.convValue).reshape(len(x), -1)
+        valueFeatures = _relu(valueFeatures @ self.fcValue1[0] + self.fcValue1[1])
+        values = np.tanh(valueFeatures @ self.fcValue2[0] + self.fcValue2[1]).reshape(len(x))
+
+        return actionProbs, values, None
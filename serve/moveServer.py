@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import queue
+import threading
+import time
+import numpy as np
+from configs.defaultConfigs import config
+from algo.MCTS import SearchTree, TreeNode
+from algo.evaluationCache import EvaluationCache
+from algo.evaluators import Evaluator, collectRequests
+from env.ChainReaction import getNewGame
+from models.inference import InferenceModel
+from utils.checkpoints import CheckpointStore
+
+class ServerBusyError(Exception):
+    pass
+
+class BatchedEvaluator(Evaluator):
+    """
+    Thread safe drop-in replacement for IntuitionPolicy. Calls from concurrent searches are queued and a single thread
+    evaluates them together: after the first request arrives it keeps collecting until maxBatchSize inputs are pending or
+    maxWait has passed, like the inference server of parallel self-play.
+    """
+    def __init__(self, intuitionPolicy, maxBatchSize, maxWait):
+        self.intuitionPolicy = intuitionPolicy
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.inputs = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __call__(self, policyInput, training = False):
+        future = concurrent.futures.Future()
+        self.requests.put((policyInput, future))
+        return future.result()
+
+    def _run(self):
+        running = True
+        while running:
+            requests, batchSize, running = collectRequests(self.requests, lambda request: len(request[0]),
+                                                           self.maxBatchSize, self.maxWait)
+            if(not requests):
+                break
+            try:
+                (intuitionProbs, intuitionValues, _) = self.intuitionPolicy(np.concatenate([policyInput for policyInput, _ in requests]))
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            intuitionProbs = np.reshape(np.asarray(intuitionProbs), (batchSize, -1))
+            intuitionValues = np.reshape(np.asarray(intuitionValues), (batchSize,))
+            self.batches += 1
+            self.inputs += batchSize
+            offset = 0
+            for policyInput, future in requests:
+                numInputs = len(policyInput)
+                future.set_result((intuitionProbs[offset: offset + numInputs], intuitionValues[offset: offset + numInputs], None))
+                offset += numInputs
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+class _LockedEvaluationCache(EvaluationCache):
+    # shared by the searches of all sessions, which run in different threads
+    def __init__(self, capacity):
+        super(_LockedEvaluationCache, self).__init__(capacity)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return super(_LockedEvaluationCache, self).get(key)
+
+    def put(self, key, intuitionProbs, intuitionValue):
+        with self.lock:
+            super(_LockedEvaluationCache, self).put(key, intuitionProbs, intuitionValue)
+
+class _Session(object):
+    def __init__(self, sessionId, searchTree: SearchTree):
+        self.sessionId = sessionId
+        self.searchTree = searchTree
+        self.lock = asyncio.Lock()
+        self.lastUsed = time.monotonic()
+
+class MoveServer(object):
+    """
+    Plays moves for many concurrent games with one intuition policy. Every session keeps its SearchTree between requests,
+    so the search below the opponent's reply is reused. Searches run in serverMaxConcurrentMoves threads and their leaf
+    evaluations are batched together by a BatchedEvaluator.
+    A move has to be answered within serverMoveLatency seconds of its arrival: the search gets whatever is left after
+    waiting for a free thread. Moves arriving while serverMaxQueuedMoves are already waiting, and new sessions beyond
+    serverMaxSessions once idle sessions have been evicted, are rejected with ServerBusyError. Sessions unused for
+    serverSessionTimeout seconds are evicted.
+    Requests and responses are json compatible dicts, handled by handleRequest for the TCP server and LocalClient alike.
+    """
+    def __init__(self, intuitionPolicy):
+        self.evaluator = BatchedEvaluator(intuitionPolicy, config.inferenceMaxBatchSize, config.inferenceMaxWait)
+        self.evaluationCache = _LockedEvaluationCache(config.evaluationCacheSize)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.serverMaxConcurrentMoves)
+        self.sessions = {}
+        self.sessionIds = itertools.count()
+        self.pendingMoves = 0
+        self.stats = {'sessionsCreated': 0, 'sessionsEvicted': 0, 'rejected': 0, 'moves': 0,
+                      'latencies': collections.deque(maxlen=1000)}
+
+    def newSession(self):
+        if(len(self.sessions) >= config.serverMaxSessions):
+            self.evictIdleSessions()
+        if(len(self.sessions) >= config.serverMaxSessions):
+            self.stats['rejected'] += 1
+            raise ServerBusyError(f'{len(self.sessions)} sessions open')
+        sessionId = str(next(self.sessionIds))
+        searchTree = SearchTree(TreeNode(getNewGame()), self.evaluator, self.evaluationCache)
+        searchTree.temperature = config.finalTemperature
+        self.sessions[sessionId] = _Session(sessionId, searchTree)
+        self.stats['sessionsCreated'] += 1
+        return sessionId
+
+    def _getSession(self, sessionId):
+        session = self.sessions.get(sessionId)
+        if(session is None):
+            raise KeyError(f'Unknown session {sessionId}')
+        session.lastUsed = time.monotonic()
+        return session
+
+    def closeSession(self, sessionId):
+        self.sessions.pop(sessionId, None)
+
+    def evictIdleSessions(self):
+        now = time.monotonic()
+        for sessionId, session in list(self.sessions.items()):
+            if(now - session.lastUsed > config.serverSessionTimeout and not session.lock.locked()):
+                del self.sessions[sessionId]
+                self.stats['sessionsEvicted'] += 1
+
+    async def play(self, sessionId, move):
+        """
+        Applies the opponent's move to the session
+        :return: True if the game is over
+        """
+        if(not isinstance(move, (list, tuple)) or len(move) != 2 or
+           not all(isinstance(x, int) and not isinstance(x, bool) for x in move)):
+            raise ValueError(f'Invalid move {move!r}, expected [row, col]')
+        session = self._getSession(sessionId)
+        async with session.lock:
+            if(session.searchTree.root.game.getReward()[1]):
+                raise ValueError('The game is over')
+            move = tuple(move)
+            if(move not in session.searchTree.root.game.getValidMoves()):
+                raise ValueError(f'Invalid move {move}')
+            return session.searchTree.advance(move)[1]
+
+    def _searchMove(self, searchTree: SearchTree, deadline):
+        searchTree.searchMove(timeBudget=max(deadline - time.monotonic(), 0.))
+        root = searchTree.root
+        move = root.selectedAction
+        # forced moves are played without expanding the root
+        value = float(root.q[root.getChildIdx(searchTree._flattenMove(move))]) if not root.isLeaf() else None
+        isTerminal = searchTree.advance(move)[1]
+        return move, value, root.simulations, isTerminal
+
+    async def getMove(self, sessionId):
+        """
+        Searches, plays and returns the session's next move
+        :return: (move, value of the move for the player who played it or None if it was forced, simulations, isTerminal)
+        """
+        arrival = time.monotonic()
+        session = self._getSession(sessionId)
+        if(self.pendingMoves >= config.serverMaxConcurrentMoves + config.serverMaxQueuedMoves):
+            self.stats['rejected'] += 1
+            raise ServerBusyError(f'{self.pendingMoves} moves pending')
+        self.pendingMoves += 1
+        try:
+            async with session.lock:
+                if(session.searchTree.root.game.getReward()[1]):
+                    raise ValueError('The game is over')
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, self._searchMove,
+                    session.searchTree, arrival + config.serverMoveLatency)
+        finally:
+            self.pendingMoves -= 1
+        session.lastUsed = time.monotonic()
+        self.stats['moves'] += 1
+        self.stats['latencies'].append(session.lastUsed - arrival)
+        return result
+
+    def getStats(self):
+        latencies = list(self.stats['latencies'])
+        return {'sessions': len(self.sessions), 'sessionsCreated': self.stats['sessionsCreated'],
+                'sessionsEvicted': self.stats['sessionsEvicted'], 'rejected': self.stats['rejected'],
+                'moves': self.stats['moves'], 'pendingMoves': self.pendingMoves,
+                'latencyP50': float(np.percentile(latencies, 50)) if latencies else 0.,
+                'latencyP95': float(np.percentile(latencies, 95)) if latencies else 0.,
+                'meanBatchSize': self.evaluator.inputs / max(self.evaluator.batches, 1),
+                'cache': self.evaluationCache.getStats()}
+
+    async def handleRequest(self, request):
+        """
+        :param request: {'op': 'new'}, {'op': 'play', 'session': id, 'move': [row, col]}, {'op': 'move', 'session': id},
+        {'op': 'close', 'session': id} or {'op': 'stats'}
+        :return: response with 'ok' set and 'error' describing why when it is False
+        """
+        if(not isinstance(request, dict)):
+            return {'ok': False, 'error': f'Invalid request {request!r}, expected a json object'}
+        op = request.get('op')
+        if(op in ('play', 'move', 'close') and not isinstance(request.get('session'), str)):
+            return {'ok': False, 'error': f'Invalid session {request.get("session")!r}, expected a string'}
+        try:
+            if(op == 'new'):
+                return {'ok': True, 'session': self.newSession()}
+            if(op == 'play'):
+                return {'ok': True, 'gameOver': await self.play(request['session'], request['move'])}
+            if(op == 'move'):
+                move, value, simulations, isTerminal = await self.getMove(request['session'])
+                return {'ok': True, 'move': list(move), 'value': value, 'simulations': simulations, 'gameOver': isTerminal}
+            if(op == 'close'):
+                self.closeSession(request['session'])
+                return {'ok': True}
+            if(op == 'stats'):
+                return {'ok': True, 'stats': self.getStats()}
+            return {'ok': False, 'error': f'Unknown op {op}'}
+        except ServerBusyError as e:
+            return {'ok': False, 'error': f'busy: {e}'}
+        except (KeyError, ValueError) as e:
+            return {'ok': False, 'error': str(e.args[0]) if e.args else type(e).__name__}
+
+    async def _evictPeriodically(self):
+        while True:
+            await asyncio.sleep(min(config.serverSessionTimeout, 60))
+            self.evictIdleSessions()
+
+    async def _handleConnection(self, reader, writer):
+        # one json request per line, answered in order
+        try:
+            while True:
+                line = await reader.readline()
+                if(not line):
+                    break
+                try:
+                    response = await self.handleRequest(json.loads(line))
+                except json.JSONDecodeError as e:
+                    response = {'ok': False, 'error': f'invalid json: {e}'}
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        evictionTask = asyncio.ensure_future(self._evictPeriodically())
+        server = await asyncio.start_server(self._handleConnection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictionTask.cancel()
+
+    def close(self):
+        self.executor.shutdown()
+        self.evaluator.close()
+
+class LocalClient(object):
+    """
+    In process client going through the same request handling as TCP connections
+    """
+    def __init__(self, server: MoveServer):
+        self.server = server
+
+    async def _request(self, request):
+        response = await self.server.handleRequest(request)
+        if(not response['ok']):
+            raise RuntimeError(response['error'])
+        return response
+
+    async def newSession(self):
+        return (await self._request({'op': 'new'}))['session']
+
+    async def play(self, sessionId, move):
+        return (await self._request({'op': 'play', 'session': sessionId, 'move': list(move)}))['gameOver']
+
+    async def getMove(self, sessionId):
+        response = await self._request({'op': 'move', 'session': sessionId})
+        return tuple(response['move']), response['gameOver']
+
+    async def close(self, sessionId):
+        await self._request({'op': 'close', 'session': sessionId})
+
+    async def getStats(self):
+        return (await self._request({'op': 'stats'}))['stats']
+
+def _getIntuitionPolicy(version):
+    from models.ResnetFeatures import getIntuitionPolicy
+    store = CheckpointStore(config.checkpointDir)
+    intuitionPolicy = getIntuitionPolicy(store.load(version if version is not None else store.getLatestVersion()))
+    if(config.useInferenceModel):
+        return InferenceModel(intuitionPolicy)
+    return intuitionPolicy
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Serves moves of a checkpoint of config.checkpointDir over TCP, one json request per line')
+    parser.add_argument('--version', type=int, help='checkpoint version, the latest by default')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    moveServer = MoveServer(_getIntuitionPolicy(args.version))
+    try:
+        asyncio.run(moveServer.serve(args.host, args.port))
+    finally:
+        moveServer.close()
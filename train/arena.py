@@ -0,0 +1,222 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+from configs.defaultConfigs import config
+from algo.MCTS import SearchTree, TreeNode
+from algo.evaluationCache import EvaluationCache
+from algo.evaluators import RolloutEvaluator
+from algo.parallelSelfPlay import getConfigValues, applyConfigValues, InferenceServer, connectClient, _getResult
+from env.ChainReaction import getNewGame
+from models.inference import InferenceModel
+from utils.checkpoints import CheckpointStore
+
+ROLLOUT = 'rollout' # pure rollout MCTS baseline, any other player is a checkpoint version
+
+def getPlayerName(player):
+    return ROLLOUT if player == ROLLOUT else f'v{player:06d}'
+
+def _getEvaluator(player, store):
+    if(player == ROLLOUT):
+        return RolloutEvaluator(config.numRollouts)
+    from models.ResnetFeatures import getIntuitionPolicy
+    intuitionPolicy = getIntuitionPolicy(store.load(player))
+    if(config.useInferenceModel):
+        return InferenceModel(intuitionPolicy)
+    return intuitionPolicy
+
+def playMatch(evaluators, firstIdx, evaluationCaches = (None, None)):
+    """
+    Plays one game between two evaluators, each searching with its own tree. Both trees follow every move so that the
+    search done while waiting for the opponent is reused. The first arenaOpeningMoves moves are sampled with
+    initialTemperature so that the games do not all repeat, the rest with finalTemperature
+    :param firstIdx: index of the evaluator that moves first
+    :return: index of the winning evaluator
+    """
+    trees = [SearchTree(TreeNode(getNewGame()), evaluator, evaluationCache)
+             for evaluator, evaluationCache in zip(evaluators, evaluationCaches)]
+    playerIdx = firstIdx
+    numMoves = 0
+    rewardTuple = (0, False)
+    while(rewardTuple[1] == False):
+        searchTree = trees[playerIdx]
+        searchTree.temperature = config.initialTemperature if numMoves < config.arenaOpeningMoves else config.finalTemperature
+        searchTree.searchMove()
+        move = searchTree.root.selectedAction
+        for searchTree in trees:
+            rewardTuple = searchTree.advance(move)
+        playerIdx = 1 - playerIdx
+        numMoves += 1
+    # the player to move has lost
+    return 1 - playerIdx
+
+def _runArenaWorker(configValues, clientArgs, taskQueue, resultQueue):
+    """
+    :param clientArgs: per player the InferenceServer.getClientArgs() of its client or None for the rollout baseline
+    """
+    applyConfigValues(configValues)
+    evaluators = [connectClient(args) if args is not None else RolloutEvaluator(config.numRollouts) for args in clientArgs]
+    evaluationCaches = [EvaluationCache(config.evaluationCacheSize) for _ in evaluators]
+    while True:
+        firstIdx = taskQueue.get()
+        if(firstIdx is None):
+            break
+        resultQueue.put((firstIdx, playMatch(evaluators, firstIdx, evaluationCaches)))
+    for evaluator, args in zip(evaluators, clientArgs):
+        if(args is not None):
+            evaluator.close()
+
+def playArena(players, numGames, numWorkers, store: CheckpointStore):
+    """
+    Plays numGames games between players[0] and players[1], the first move alternating between them. With numWorkers
+    processes every checkpoint gets its own inference server that batches the leaves of all workers, with 0 workers
+    the games are played in this process
+    :return: match result as stored by EloTable.addResult
+    """
+    wins = [0, 0]
+    winsMovingFirst = [0, 0]
+    t1 = time.time()
+    if(numWorkers == 0):
+        evaluators = [_getEvaluator(player, store) for player in players]
+        evaluationCaches = [EvaluationCache(config.evaluationCacheSize) for _ in players]
+        results = (((gameIdx % 2), playMatch(evaluators, gameIdx % 2, evaluationCaches)) for gameIdx in range(numGames))
+    else:
+        context = mp.get_context('spawn')
+        taskQueue = context.Queue()
+        resultQueue = context.Queue()
+        for gameIdx in range(numGames):
+            taskQueue.put(gameIdx % 2)
+        for _ in range(numWorkers):
+            taskQueue.put(None)
+        servers = [InferenceServer(context, store.load(player), numWorkers) if player != ROLLOUT else None
+                   for player in players]
+        workers = [context.Process(target=_runArenaWorker, args=(getConfigValues(),
+                   [server.getClientArgs(workerIdx) if server is not None else None for server in servers],
+                   taskQueue, resultQueue), daemon=True)
+                   for workerIdx in range(numWorkers)]
+        for worker in workers:
+            worker.start()
+        processes = workers + [server.process for server in servers if server is not None]
+        results = (_getResult(resultQueue, processes) for _ in range(numGames))
+
+    try:
+        for firstIdx, winnerIdx in results:
+            wins[winnerIdx] += 1
+            if(winnerIdx == firstIdx):
+                winsMovingFirst[winnerIdx] += 1
+        if(numWorkers > 0):
+            for worker in workers:
+                worker.join()
+    finally:
+        if(numWorkers > 0):
+            # only stops workers that are still playing because another one failed
+            for worker in workers:
+                worker.terminate()
+            for server in servers:
+                if(server is not None):
+                    server.stop()
+    t2 = time.time()
+    print(f'Played {numGames} arena games with {numWorkers} workers in {t2-t1:.1f}s ({numGames*3600/(t2-t1):.0f} games/hour)')
+    return {'players': [getPlayerName(player) for player in players], 'games': numGames, 'wins': wins,
+            'winsMovingFirst': winsMovingFirst}
+
+def getConfidenceInterval(wins, numGames, z = 1.96):
+    """
+    :return: (low, high) Wilson score interval of the win rate, 95% by default
+    """
+    if(numGames == 0):
+        return 0., 1.
+    winRate = wins / numGames
+    denominator = 1 + z * z / numGames
+    center = (winRate + z * z / (2 * numGames)) / denominator
+    margin = z * math.sqrt(winRate * (1 - winRate) / numGames + z * z / (4 * numGames * numGames)) / denominator
+    return max(0., center - margin), min(1., center + margin)
+
+def getEloDifference(winRate, numGames):
+    """
+    :return: rating difference that predicts winRate. Win rates of 0 and 1 are treated as half a game away from them
+    """
+    winRate = min(max(winRate, 0.5 / numGames), 1 - 0.5 / numGames)
+    return -400 * math.log10(1 / winRate - 1)
+
+class EloTable(object):
+    """
+    Elo ratings of arena players in a json file, with the history of every match that changed them.
+    The first player ever rated gets initialRating. A player without a rating is rated from its result against a rated
+    opponent, which keeps its rating. Matches between rated players move both ratings by kFactor per game.
+    """
+    def __init__(self, path, kFactor = 4, initialRating = 0):
+        self.path = path
+        self.kFactor = kFactor
+        self.initialRating = initialRating
+        self.ratings = {}
+        self.history = []
+        if(os.path.exists(path)):
+            with open(path) as f:
+                table = json.load(f)
+            self.ratings = table['ratings']
+            self.history = table['history']
+
+    def getRating(self, name):
+        return self.ratings.get(name)
+
+    def addResult(self, result):
+        nameA, nameB = result['players']
+        winsA, numGames = result['wins'][0], result['games']
+        if(nameA not in self.ratings and nameB not in self.ratings):
+            self.ratings[nameB] = self.initialRating
+        if(nameA not in self.ratings):
+            self.ratings[nameA] = self.ratings[nameB] + getEloDifference(winsA / numGames, numGames)
+        elif(nameB not in self.ratings):
+            self.ratings[nameB] = self.ratings[nameA] - getEloDifference(winsA / numGames, numGames)
+        else:
+            expectedA = 1 / (1 + 10 ** ((self.ratings[nameB] - self.ratings[nameA]) / 400))
+            delta = self.kFactor * (winsA - numGames * expectedA)
+            self.ratings[nameA] += delta
+            self.ratings[nameB] -= delta
+        self.history.append(dict(result, ratings=[self.ratings[nameA], self.ratings[nameB]], time=time.time()))
+        self._save()
+
+    def _save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'ratings': self.ratings, 'history': self.history}, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+    def printTable(self):
+        for name, rating in sorted(self.ratings.items(), key=lambda item: -item[1]):
+            print(f'{name:>10} {rating:8.1f}')
+
+def _parsePlayer(player, store):
+    if(player == ROLLOUT):
+        return ROLLOUT
+    latestVersion = store.getLatestVersion()
+    if(player == 'latest'):
+        if(latestVersion is None):
+            raise ValueError(f'No checkpoints in {store.directory}, play {ROLLOUT} or a version instead of latest')
+        return latestVersion
+    if(player == 'previous'):
+        return latestVersion - 1 if latestVersion is not None and latestVersion > 0 else ROLLOUT
+    return int(player)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Plays two checkpoints of config.checkpointDir against each other and '
+                                                 'updates the Elo table kept next to them')
+    parser.add_argument('playerA', nargs='?', default='latest', help="checkpoint version, 'latest', 'previous' or 'rollout'")
+    parser.add_argument('playerB', nargs='?', default='previous', help="checkpoint version, 'latest', 'previous' or 'rollout'")
+    parser.add_argument('--games', type=int, default=config.arenaGames)
+    parser.add_argument('--workers', type=int, default=config.numSelfPlayWorkers)
+    args = parser.parse_args()
+
+    store = CheckpointStore(config.checkpointDir)
+    players = [_parsePlayer(args.playerA, store), _parsePlayer(args.playerB, store)]
+    result = playArena(players, args.games, args.workers, store)
+    nameA, nameB = result['players']
+    winsA = result['wins'][0]
+    low, high = getConfidenceInterval(winsA, args.games)
+    print(f'{nameA} vs {nameB}: {winsA}/{args.games} wins, win rate {winsA/args.games:.3f} [{low:.3f}, {high:.3f}], '
+          f'{result["winsMovingFirst"]} wins moving first, Elo difference {getEloDifference(winsA/args.games, args.games):+.0f}')
+    eloTable = EloTable(os.path.join(config.checkpointDir, 'elo.json'))
+    eloTable.addResult(result)
+    eloTable.printTable()
@@ -0,0 +1,111 @@
+import multiprocessing as mp
+import queue
+from configs.defaultConfigs import config
+from algo.MCTS import playGame
+from algo.evaluationCache import EvaluationCache
+from algo.parallelSelfPlay import getConfigValues, applyConfigValues
+from models.ResnetFeatures import getIntuitionPolicy
+from models.inference import InferenceModel
+from train.fullTraining import trainLoop, getOptimizer, getSteps
+from utils.buffer import Buffer
+from utils.checkpoints import CheckpointStore
+from utils.gameRecords import getGameRecordWriter
+from utils.instrumentation import getInstrumentation
+
+def _runActor(configValues, resultQueue, stopEvent):
+    """
+    Plays self-play games until stopEvent is set, reloading the latest published weights between games.
+    Every finished game is sent as (modelVersion, gameTrace, instrumentation summary)
+    """
+    applyConfigValues(configValues)
+    store = CheckpointStore(config.checkpointDir)
+    instrumentation = getInstrumentation()
+    intuitionPolicy = getIntuitionPolicy()
+    version = None
+    while not stopEvent.is_set():
+        latestVersion = store.getLatestVersion()
+        if(latestVersion != version):
+            version = latestVersion
+            intuitionPolicy.set_weights(store.load(version))
+            evaluator = InferenceModel(intuitionPolicy) if config.useInferenceModel else intuitionPolicy
+            # cached evaluations belong to the previous weights
+            evaluationCache = EvaluationCache(config.evaluationCacheSize)
+        gameTrace = playGame(evaluator, evaluationCache)
+        resultQueue.put((version, gameTrace, instrumentation.takeSummary()))
+
+def _drainResults(resultQueue, buf, minSize, processes, gameRecords = None):
+    """
+    Moves all finished games into buf, and gameRecords if given, waiting for more while buf holds less than minSize
+    positions
+    :return: number of games added
+    """
+    numGames = 0
+    while True:
+        try:
+            version, gameTrace, summary = resultQueue.get(timeout=1.0 if len(buf) < minSize else 0)
+        except queue.Empty:
+            if(len(buf) >= minSize):
+                return numGames
+            for process in processes:
+                if(process.exitcode not in (None, 0)):
+                    raise RuntimeError(f'{process.name} exited with code {process.exitcode}')
+            continue
+        buf.addData(gameTrace, version)
+        if(gameRecords is not None):
+            gameRecords.write(gameTrace, version)
+        getInstrumentation().addSummary(summary)
+        numGames += 1
+
+def trainBrainAsync(config):
+    """
+    Pipelined version of fullTraining.trainBrain: config.numActors processes keep playing with the latest published
+    weights while this process trains on the replay buffer and publishes a new checkpoint after every training round.
+    Published versions are kept in config.checkpointDir, an existing directory resumes from its latest version.
+    """
+    intuitionPolicy = getIntuitionPolicy()
+    print(intuitionPolicy.summary())
+    store = CheckpointStore(config.checkpointDir)
+    version = store.getLatestVersion()
+    if(version is None):
+        version = store.publish(intuitionPolicy.get_weights())
+    else:
+        intuitionPolicy.set_weights(store.load(version))
+    buf = Buffer(config.totalRows, config.totalCols, config.numPlayers, config.replayBufferSize, config.replayBufferDir,
+                 config.replayShardSize)
+    gameRecords = getGameRecordWriter()
+    # one optimizer for the whole run, so that its moments and learning rate schedule carry over between rounds and the
+    # training step is only traced once. The learning rate decays per round of samplesPerTraining in batches of 32
+    steps = getSteps(intuitionPolicy, getOptimizer(max(1, config.samplesPerTraining // 32)))
+
+    context = mp.get_context('spawn')
+    resultQueue = context.Queue()
+    stopEvent = context.Event()
+    actors = [context.Process(target=_runActor, args=(getConfigValues(), resultQueue, stopEvent), daemon=True)
+              for _ in range(config.numActors)]
+    for actor in actors:
+        actor.start()
+
+    try:
+        for i in range(config.totalLearningIterations):
+            numGames = _drainResults(resultQueue, buf, config.minReplaySize, actors, gameRecords)
+            inputs, actualValues, analysisProbs, modelVersions = buf.sample(min(len(buf), config.samplesPerTraining),
+                fields=('states', 'rewards', 'analysisProbs', 'modelVersions'))
+            staleness = version - modelVersions
+            trainLoop(intuitionPolicy, inputs, actualValues, analysisProbs, numEpochs=1, steps=steps)
+            version = store.publish(intuitionPolicy.get_weights())
+            print(f'Published version {version}: {numGames} new games: replay size {len(buf)}: '
+                  f'staleness mean {staleness.mean():.2f} max {staleness.max()}')
+            getInstrumentation().endIteration()
+    finally:
+        stopEvent.set()
+        # actors block on exit until the games they queued are consumed
+        for actor in actors:
+            while actor.is_alive():
+                try:
+                    resultQueue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            actor.join()
+
+if __name__=='__main__':
+    trainBrainAsync(config)
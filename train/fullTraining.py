@@ -1,12 +1,17 @@
+import time
 import numpy as np
 import tensorflow as tf
 from configs.defaultConfigs import config
 from algo.MCTS import ExperienceCollector
-from models.ResnetFeatures import IntuitionPolicy
+from algo.parallelSelfPlay import ParallelExperienceCollector
+from utils.buffer import Buffer
+from utils.symmetry import getPermutations
+from models.ResnetFeatures import getIntuitionPolicy
+from utils.instrumentation import getInstrumentation
 
 from sklearn.utils import shuffle
-def loss(model, inputs, actualValues, analysisProbs):
-    _, predictedValues, intuitionLogitProbs = model(inputs, training = True)
+def loss(model, inputs, actualValues, analysisProbs, training = True):
+    _, predictedValues, intuitionLogitProbs = model(inputs, training = training)
     mainLoss =  tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(analysisProbs, intuitionLogitProbs) + tf.keras.losses.MSE(actualValues, predictedValues))
     regLoss = tf.add_n(model.losses)
     return tf.add(mainLoss, regLoss)
@@ -25,51 +30,102 @@ def getOptimizer(datasetSize):
 
     return tf.keras.optimizers.Adam(lr_schedule)
 
-def trainLoop(model, inputs, actualValues, analysisProbs, numValidation = 1000, numEpochs = 10, batchSize = 32):
-    optimizer = getOptimizer()
-
-    permutation = np.random.permutation(len(inputs))
+def getSteps(model, optimizer):
+    """
+    :return: (trainStep, valStep) compiled into graphs for model and optimizer. Both return the loss of the batch
+    """
+    @tf.function
+    def trainStep(inputBatch, actualValuesBatch, analysisProbsBatch):
+        lossValue, grads = grad(model, inputBatch, actualValuesBatch, analysisProbsBatch)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return lossValue
+
+    @tf.function
+    def valStep(inputBatch, actualValuesBatch, analysisProbsBatch):
+        return loss(model, inputBatch, actualValuesBatch, analysisProbsBatch, training = False)
+
+    return trainStep, valStep
+
+def getSymmetryAugmentation(totalRows, totalCols, numPlayers):
+    """
+    :return: dataset map function that transforms every example of a batch by a random symmetry of the board
+    """
+    permutations = tf.constant(getPermutations(totalRows, totalCols), dtype=tf.int32)
+
+    def augmentBatch(inputBatch, actualValuesBatch, analysisProbsBatch):
+        batchSize = tf.shape(inputBatch)[0]
+        symmetryIdxs = tf.random.uniform([batchSize], 0, permutations.shape[0], dtype=tf.int32)
+        batchPermutations = tf.gather(permutations, symmetryIdxs)
+        flatInputs = tf.reshape(inputBatch, [batchSize, totalRows * totalCols, numPlayers])
+        inputBatch = tf.reshape(tf.gather(flatInputs, batchPermutations, batch_dims=1), [batchSize, totalRows, totalCols, numPlayers])
+        analysisProbsBatch = tf.gather(analysisProbsBatch, batchPermutations, batch_dims=1)
+        return inputBatch, actualValuesBatch, analysisProbsBatch
+
+    return augmentBatch
+
+def getDatasets(inputs, actualValues, analysisProbs, numValidation, batchSize, augmentSymmetries = False):
+    """
+    Splits the data in a shuffled, batched training dataset and a batched validation dataset, both prefetched.
+    With augmentSymmetries every training example is seen under a random symmetry of the board, drawn again each epoch
+    """
     inputs, actualValues, analysisProbs = shuffle(inputs, actualValues, analysisProbs)
+    inputs = inputs.astype(np.float32)
+    actualValues = actualValues.astype(np.float32)
+    analysisProbs = analysisProbs.astype(np.float32)
 
     trainInputs, trainActualValues, trainAnalysisProbs = inputs[numValidation:], actualValues[numValidation:], analysisProbs[numValidation:]
     valInputs, valActualValues, valAnalysisProbs = inputs[:numValidation], actualValues[: numValidation], analysisProbs[: numValidation]
 
-    trainDataset = tf.data.Dataset.from_tensor_slices((trainInputs, (trainActualValues, trainAnalysisProbs)))
-    valDataset = tf.data.Dataset.from_tensor_slices((valInputs, (valActualValues, valAnalysisProbs)))
-
-    trainDataset.batch(batchSize).repeat(numEpochs)
-    valDataset.batch(batchSize).repeat(numEpochs)
+    trainDataset = tf.data.Dataset.from_tensor_slices((trainInputs, trainActualValues, trainAnalysisProbs))
+    valDataset = tf.data.Dataset.from_tensor_slices((valInputs, valActualValues, valAnalysisProbs))
+
+    # full batches only so that trainStep is traced once
+    trainDataset = trainDataset.shuffle(len(trainInputs), reshuffle_each_iteration=True).batch(batchSize, drop_remainder=True)
+    if(augmentSymmetries):
+        trainDataset = trainDataset.map(getSymmetryAugmentation(*inputs.shape[1:]), num_parallel_calls=tf.data.AUTOTUNE)
+    trainDataset = trainDataset.prefetch(tf.data.AUTOTUNE)
+    valDataset = valDataset.batch(batchSize).prefetch(tf.data.AUTOTUNE)
+    return trainDataset, valDataset, len(trainInputs) // batchSize
+
+def trainLoop(model, inputs, actualValues, analysisProbs, numValidation = 1000, numEpochs = 10, batchSize = 32,
+              augmentSymmetries = config.augmentSymmetries, steps = None):
+    """
+    :param steps: (trainStep, valStep) from getSteps to keep training with, by default a new optimizer is made whose
+    learning rate decays over the epochs of this call
+    """
+    numValidation = min(numValidation, len(inputs) // 10)
+    trainDataset, valDataset, stepsPerEpoch = getDatasets(inputs, actualValues, analysisProbs, numValidation, batchSize,
+                                                          augmentSymmetries)
+    if(steps is None):
+        steps = getSteps(model, getOptimizer(max(1, stepsPerEpoch)))
+    trainStep, valStep = steps
 
     for epoch in range(numEpochs):
         epoch_loss_avg = tf.keras.metrics.Mean()
         epoch_val_loss_avg = tf.keras.metrics.Mean()
-        for inputBatch, outBatch in trainDataset:
-            actualValuesBatch = outBatch[0]
-            analysisProbsBatch = outBatch[1]
-            lossValue, grads = grad(model, inputBatch, actualValuesBatch, analysisProbsBatch)
-            optimizer.apply_gradients(zip(grads, model.trainable_variables))
-            epoch_loss_avg(lossValue)
-
+        t1 = time.time()
+        for inputBatch, actualValuesBatch, analysisProbsBatch in trainDataset:
+            epoch_loss_avg(trainStep(inputBatch, actualValuesBatch, analysisProbsBatch))
+        t2 = time.time()
 
-        for inputBatch, outBatch in valDataset:
-            actualValuesBatch = outBatch[0]
-            analysisProbsBatch = outBatch[1]
-            lossValue = loss(model, inputBatch, actualValuesBatch, analysisProbsBatch)
-            epoch_val_loss_avg(lossValue)
+        for inputBatch, actualValuesBatch, analysisProbsBatch in valDataset:
+            epoch_val_loss_avg(valStep(inputBatch, actualValuesBatch, analysisProbsBatch))
+        t3 = time.time()
 
-        print(f'Epoch: {epoch}: trainLoss: {epoch_loss_avg.result()}: valLoss: {epoch_val_loss_avg}')
+        print(f'Epoch: {epoch}: trainLoss: {epoch_loss_avg.result()}: valLoss: {epoch_val_loss_avg.result()}: '
+              f'train: {t2-t1:.1f}s ({stepsPerEpoch*batchSize/(t2-t1):.0f} examples/s): val: {t3-t2:.1f}s')
 
 
 def trainBrain(config):
-    intuitionPolicy = IntuitionPolicy(config.totalRows, config.totalCols, config.numPlayers, config.l2Weight, config.numResnetBlocks,
-    config.filters)
-    intuitionPolicy.build(input_shape = (None, config.totalRows, config.totalCols, config.numPlayers))
+    intuitionPolicy = getIntuitionPolicy()
     print(intuitionPolicy.summary())
+    buf = Buffer(config.totalRows, config.totalCols, config.numPlayers, config.replayBufferSize, config.replayBufferDir,
+                 config.replayShardSize)
     for i in range(config.totalLearningIterations):
-        exp = ExperienceCollector()
+        exp = ParallelExperienceCollector(config.numSelfPlayWorkers, buf) if config.numSelfPlayWorkers > 0 else ExperienceCollector(buf)
         exp.collectExperience(config.gamesPerTraining, intuitionPolicy)
-        buf = exp.buffer
-        inputs, actualValues, analysisProbs = buf.states, buf.rewards, buf.analysisProbs
+        getInstrumentation().endIteration()
+        inputs, actualValues, analysisProbs = buf.sample(min(len(buf), config.samplesPerTraining))
         trainLoop(intuitionPolicy, inputs, actualValues, analysisProbs)
         print(f'Done {i} runs of self play')
 
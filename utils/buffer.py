@@ -1,25 +1,160 @@
-from algo.MCTS import TreeNode
+from utils.misc import transform
+import json
+import os
 import numpy as np
+
 class Buffer(object):
-    def __init__(self, totalRows = 5, totalCols = 5, numPlayers = 2):
+    """
+    Fixed capacity replay store. Positions are written in a ring, once capacity is reached every new position replaces
+    the oldest one. Storage is split in shards of shardSize positions. With a directory every shard field is a memory
+    mapped .npy file, so the window can be far larger than RAM and survives between runs: the write position is kept in
+    meta.json and an existing store with the same layout is reopened.
+    """
+    def __init__(self, totalRows = 5, totalCols = 5, numPlayers = 2, capacity = 100000, directory = None, shardSize = 65536):
         self.totalRows = totalRows
         self.totalCols = totalCols
         self.numPlayers = numPlayers
-        self.states = np.empty((0, totalRows, totalCols, numPlayers), dtype=float)
-        self.actions = np.empty((0, 2), dtype=int)
-        self.playerIdx = np.empty((0,), dtype=int)
-        self.intuitionProbs = np.empty((0, totalRows * totalCols), dtype=float)
-        self.analysisProbs = np.empty((0, totalRows * totalCols), dtype=float)
-        self.rewards = np.empty((0), dtype=float)
-
-    def addData(self, gameTrace: list):
+        self.capacity = capacity
+        self.directory = directory
+        self.shardSize = min(shardSize, capacity)
+        self.fields = {
+            'states': ((totalRows, totalCols, numPlayers), np.float32),
+            'actions': ((2,), np.int16),
+            'playerIdx': ((), np.int8),
+            'intuitionProbs': ((totalRows * totalCols,), np.float32),
+            'analysisProbs': ((totalRows * totalCols,), np.float32),
+            'rewards': ((), np.float32),
+            'modelVersions': ((), np.int32),
+        }
+        self.head = 0 # ring index the next position is written to
+        self.size = 0
+        meta = self._loadMeta()
+        self.shards = [self._openShard(shardIdx, meta is not None) for shardIdx in range(self._numShards())]
+        if(meta is not None):
+            self.head = meta['head']
+            self.size = meta['size']
+
+    def _numShards(self):
+        return (self.capacity + self.shardSize - 1) // self.shardSize
+
+    def _getLayout(self):
+        return {'totalRows': self.totalRows, 'totalCols': self.totalCols, 'numPlayers': self.numPlayers,
+                'capacity': self.capacity, 'shardSize': self.shardSize, 'fields': sorted(self.fields)}
+
+    def _loadMeta(self):
+        if(self.directory is None):
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        metaPath = os.path.join(self.directory, 'meta.json')
+        if(not os.path.exists(metaPath)):
+            return None
+        with open(metaPath) as f:
+            meta = json.load(f)
+        if(meta['layout'] != self._getLayout()):
+            raise ValueError(f'Buffer at {self.directory} has layout {meta["layout"]}, expected {self._getLayout()}')
+        return meta
+
+    def _saveMeta(self):
+        if(self.directory is None):
+            return
+        for shard in self.shards:
+            for array in shard.values():
+                array.flush()
+        metaPath = os.path.join(self.directory, 'meta.json')
+        with open(metaPath + '.tmp', 'w') as f:
+            json.dump({'layout': self._getLayout(), 'head': self.head, 'size': self.size}, f)
+        os.replace(metaPath + '.tmp', metaPath)
+
+    def _openShard(self, shardIdx, exists):
+        shardLength = min(self.shardSize, self.capacity - shardIdx * self.shardSize)
+        shard = {}
+        for name, (shape, dtype) in self.fields.items():
+            if(self.directory is None):
+                shard[name] = np.zeros((shardLength,) + shape, dtype=dtype)
+            else:
+                path = os.path.join(self.directory, f'{name}_{shardIdx:04d}.npy')
+                if(exists):
+                    shard[name] = np.load(path, mmap_mode='r+')
+                else:
+                    shard[name] = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(shardLength,) + shape)
+        return shard
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, playerIdx, intuitionProbs, analysisProbs, reward, modelVersion = 0):
+        shard = self.shards[self.head // self.shardSize]
+        offset = self.head % self.shardSize
+        shard['states'][offset] = state
+        shard['actions'][offset] = action
+        shard['playerIdx'][offset] = playerIdx
+        shard['intuitionProbs'][offset] = intuitionProbs
+        shard['analysisProbs'][offset] = analysisProbs
+        shard['rewards'][offset] = reward
+        shard['modelVersions'][offset] = modelVersion
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def addData(self, gameTrace: list, modelVersion = 0):
+        """
+        :param modelVersion: version of the weights that played the game
+        """
         for i in range(len(gameTrace)):
             treeNode = gameTrace[i]
-            state = self.transform(treeNode.game)
-            self.states = np.append(self.states, np.expand_dims(state, axis=0), axis = 0)
-            self.actions = np.append(self.actions, np.expand_dims(
-                                     np.array([treeNode.selectedAction.row, treeNode.selectedAction.col]), axis = 0), axis = 0)
-            self.playerIdx = np.append(self.playerIdx, treeNode.selectedAction.playerIdx)
-            self.intuitionProbs = np.append(self.intuitionProbs, np.expand_dims(treeNode.intuitionProbs, axis = 0), axis = 0)
-            self.analysisProbs = np.append(self.analysisProbs, np.expand_dims(treeNode.analysisProbs, axis = 0), axis = 0)
-            self.rewards = np.append(self.rewards, treeNode.outcome)
\ No newline at end of file
+            self.add(transform(treeNode.game), treeNode.selectedAction, treeNode.game.curPlayer,
+                     treeNode.intuitionProbs, treeNode.analysisProbs, treeNode.outcome, modelVersion)
+        self._saveMeta()
+
+    def _getWindow(self):
+        """
+        :return: ring indices of all stored positions, oldest first
+        """
+        return (self.head - self.size + np.arange(self.size)) % self.capacity
+
+    def gather(self, name, ringIdxs):
+        """
+        :return: the values of field name at ringIdxs. Only the shards that are hit are read
+        """
+        shape, dtype = self.fields[name]
+        values = np.empty((len(ringIdxs),) + shape, dtype=dtype)
+        shardIdxs = ringIdxs // self.shardSize
+        for shardIdx in np.unique(shardIdxs):
+            mask = shardIdxs == shardIdx
+            values[mask] = self.shards[shardIdx][name][ringIdxs[mask] % self.shardSize]
+        return values
+
+    def sample(self, batchSize, rng = np.random, fields = ('states', 'rewards', 'analysisProbs')):
+        """
+        Samples batchSize positions uniformly from the window, with replacement
+        :return: tuple with the sampled values of every field in fields
+        """
+        ringIdxs = self._getWindow()[rng.randint(self.size, size=batchSize)]
+        return tuple(self.gather(name, ringIdxs) for name in fields)
+
+    @property
+    def states(self):
+        return self.gather('states', self._getWindow())
+
+    @property
+    def actions(self):
+        return self.gather('actions', self._getWindow())
+
+    @property
+    def playerIdx(self):
+        return self.gather('playerIdx', self._getWindow())
+
+    @property
+    def intuitionProbs(self):
+        return self.gather('intuitionProbs', self._getWindow())
+
+    @property
+    def analysisProbs(self):
+        return self.gather('analysisProbs', self._getWindow())
+
+    @property
+    def rewards(self):
+        return self.gather('rewards', self._getWindow())
+
+    @property
+    def modelVersions(self):
+        return self.gather('modelVersions', self._getWindow())
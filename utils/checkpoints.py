@@ -0,0 +1,55 @@
+import json
+import os
+import numpy as np
+
+class CheckpointStore(object):
+    """
+    Versioned model weights on local disk. Every publish writes weights_<version>.npz and then points latest.json at it,
+    both through an atomic rename, so readers in other processes never see a partially written checkpoint.
+    Only the newest numToKeep checkpoints are kept.
+    """
+    def __init__(self, directory, numToKeep = 5):
+        self.directory = directory
+        self.numToKeep = numToKeep
+        os.makedirs(directory, exist_ok=True)
+
+    def _getPath(self, version):
+        return os.path.join(self.directory, f'weights_{version:06d}.npz')
+
+    def getLatestVersion(self):
+        """
+        :return: the newest published version or None if nothing was published yet
+        """
+        latestPath = os.path.join(self.directory, 'latest.json')
+        if(not os.path.exists(latestPath)):
+            return None
+        with open(latestPath) as f:
+            return json.load(f)['version']
+
+    def publish(self, weights):
+        """
+        :param weights: list of arrays as returned by get_weights()
+        :return: the version of the new checkpoint
+        """
+        latestVersion = self.getLatestVersion()
+        version = 0 if latestVersion is None else latestVersion + 1
+        path = self._getPath(version)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, *weights)
+        os.replace(path + '.tmp', path)
+
+        latestPath = os.path.join(self.directory, 'latest.json')
+        with open(latestPath + '.tmp', 'w') as f:
+            json.dump({'version': version}, f)
+        os.replace(latestPath + '.tmp', latestPath)
+
+        if(version - self.numToKeep >= 0 and os.path.exists(self._getPath(version - self.numToKeep))):
+            os.remove(self._getPath(version - self.numToKeep))
+        return version
+
+    def load(self, version):
+        """
+        :return: the weights of version as a list of arrays, in set_weights() order
+        """
+        with np.load(self._getPath(version)) as weights:
+            return [weights[f'arr_{i}'] for i in range(len(weights.files))]
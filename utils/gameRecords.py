@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+import numpy as np
+from configs.defaultConfigs import config
+from env.ChainReaction import Game
+from utils.misc import transform
+
+_MAGIC = b'CRGAMES1\n'
+_GAME_HEADER = struct.Struct('<iH') # modelVersion, number of moves
+
+def _getCellDtype(totalRows, totalCols):
+    return np.uint8 if totalRows * totalCols <= 256 else np.uint16
+
+def _quantizeProbs(probs):
+    """
+    :return: (cells, levels) of the nonzero cells of probs, every probability scaled to 1..255 relative to the largest
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    levels = np.rint(probs * (255. / probs.max()))
+    cells = np.flatnonzero(levels)
+    return cells, levels[cells].astype(np.uint8)
+
+def encodeGame(gameTrace, totalRows, totalCols, modelVersion = 0):
+    """
+    :param gameTrace: positions of a finished game as returned by playGame, with selectedAction, analysisProbs and
+    outcome set
+    :return: the game as one compressed record. Only the moves, the outcomes and the analysisProbs are kept, the
+    latter sparse and quantized to 8 bits relative to the most visited move
+    """
+    cellDtype = _getCellDtype(totalRows, totalCols)
+    moves = np.array([node.selectedAction[0] * totalCols + node.selectedAction[1] for node in gameTrace], dtype=cellDtype)
+    outcomes = np.array([node.outcome for node in gameTrace], dtype=np.int8)
+    sparseProbs = [_quantizeProbs(node.analysisProbs) for node in gameTrace]
+    numNonzero = np.array([len(cells) for cells, _ in sparseProbs], dtype=np.uint16)
+    cells = np.concatenate([cells for cells, _ in sparseProbs]).astype(cellDtype)
+    levels = np.concatenate([levels for _, levels in sparseProbs])
+    # one column after the other, similar values next to each other compress best
+    payload = b''.join([_GAME_HEADER.pack(modelVersion, len(gameTrace)), moves.tobytes(), outcomes.tobytes(),
+                        numNonzero.tobytes(), cells.tobytes(), levels.tobytes()])
+    return zlib.compress(payload, 9)
+
+def decodeGame(record, totalRows, totalCols):
+    """
+    :return: dict with the modelVersion, the (numMoves, 2) moves, the (numMoves,) outcomes and the (numMoves,
+    totalRows*totalCols) analysisProbs of a record made by encodeGame
+    """
+    cellDtype = _getCellDtype(totalRows, totalCols)
+    payload = zlib.decompress(record)
+    modelVersion, numMoves = _GAME_HEADER.unpack_from(payload)
+    offset = _GAME_HEADER.size
+
+    def read(dtype, count):
+        nonlocal offset
+        values = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    moves = read(cellDtype, numMoves).astype(np.int64)
+    outcomes = read(np.int8, numMoves).astype(np.float32)
+    numNonzero = read(np.uint16, numMoves)
+    cells = read(cellDtype, int(numNonzero.sum()))
+    levels = read(np.uint8, int(numNonzero.sum()))
+    analysisProbs = np.zeros((numMoves, totalRows * totalCols), dtype=np.float32)
+    analysisProbs[np.repeat(np.arange(numMoves), numNonzero), cells] = levels
+    analysisProbs /= analysisProbs.sum(axis=1, keepdims=True)
+    return {'modelVersion': modelVersion, 'moves': np.stack([moves // totalCols, moves % totalCols], axis=1),
+            'outcomes': outcomes, 'analysisProbs': analysisProbs}
+
+class GameRecordWriter(object):
+    """
+    Appends finished self-play games to a record file: a json header line with the board after a magic line, then one
+    length prefixed encodeGame record per game. The file is opened for every game written, so an interrupted run loses
+    at most the game being written: readers skip a truncated last record and a new writer cuts it off before appending.
+    """
+    def __init__(self, path, totalRows, totalCols, numPlayers):
+        self.path = path
+        self.header = {'totalRows': totalRows, 'totalCols': totalCols, 'numPlayers': numPlayers}
+        self.numGames = 0
+        if(os.path.exists(path) and os.path.getsize(path) > 0):
+            with open(path, 'r+b') as f:
+                header = _readHeader(f, path)
+                if(header != self.header):
+                    raise ValueError(f'Game records at {path} are for {header}, expected {self.header}')
+                # drop the partial record an interrupted run may have left, later records would be unreadable after it
+                end = f.tell()
+                for _ in _readRecords(f):
+                    end = f.tell()
+                f.truncate(end)
+        else:
+            with open(path, 'wb') as f:
+                f.write(_MAGIC + json.dumps(self.header).encode() + b'\n')
+
+    def write(self, gameTrace, modelVersion = 0):
+        """
+        :param modelVersion: version of the weights that played the game
+        """
+        record = encodeGame(gameTrace, self.header['totalRows'], self.header['totalCols'], modelVersion)
+        with open(self.path, 'ab') as f:
+            f.write(struct.pack('<I', len(record)) + record)
+        self.numGames += 1
+
+def _readHeader(f, path):
+    if(f.readline() != _MAGIC):
+        raise ValueError(f'{path} is not a game record file')
+    return json.loads(f.readline())
+
+def _readRecords(f):
+    """
+    Generator over the length prefixed records of f from its current position, stops at a truncated record
+    """
+    while True:
+        prefix = f.read(4)
+        if(len(prefix) < 4):
+            return
+        length = struct.unpack('<I', prefix)[0]
+        record = f.read(length)
+        if(len(record) < length):
+            return
+        yield record
+
+def readHeader(path):
+    with open(path, 'rb') as f:
+        return _readHeader(f, path)
+
+def readGames(path):
+    """
+    Generator over the decodeGame dicts of all complete games in a record file, read one at a time
+    """
+    with open(path, 'rb') as f:
+        header = _readHeader(f, path)
+        for record in _readRecords(f):
+            yield decodeGame(record, header['totalRows'], header['totalCols'])
+
+def replayGame(game, header):
+    """
+    Generator over (position, move, analysisProbs, outcome) for every move of a game read by readGames, replayed
+    through the engine from a new game
+    """
+    position = Game(header['totalRows'], header['totalCols'], header['numPlayers'])
+    for move, analysisProbs, outcome in zip(game['moves'], game['analysisProbs'], game['outcomes']):
+        yield position, (int(move[0]), int(move[1])), analysisProbs, outcome
+        position = position.getNextState((int(move[0]), int(move[1])))
+
+def readTrainingData(path):
+    """
+    Generator over (states, rewards, analysisProbs) of every game in a record file, the arrays Buffer.sample returns by
+    default. States are made by replaying the moves, so changing transform re-featurizes archived games
+    """
+    header = readHeader(path)
+    for game in readGames(path):
+        states = [transform(position) for position, _, _, _ in replayGame(game, header)]
+        yield np.array(states, dtype=np.float32), game['outcomes'], game['analysisProbs']
+
+def getGameRecordWriter():
+    """
+    :return: writer appending to games_<rows>x<cols>.bin in config.gameRecordDir, None if recording is disabled
+    """
+    if(config.gameRecordDir is None):
+        return None
+    os.makedirs(config.gameRecordDir, exist_ok=True)
+    path = os.path.join(config.gameRecordDir, f'games_{config.totalRows}x{config.totalCols}.bin')
+    return GameRecordWriter(path, config.totalRows, config.totalCols, config.numPlayers)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Summarizes a self-play game record file')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    numGames = numPositions = 0
+    for game in readGames(args.path):
+        numGames += 1
+        numPositions += len(game['moves'])
+    size = os.path.getsize(args.path)
+    print(f'{args.path}: {readHeader(args.path)}: {numGames} games, {numPositions} positions, {size} bytes '
+          f'({size/max(numPositions, 1):.1f} bytes per position)')
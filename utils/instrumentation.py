@@ -0,0 +1,210 @@
+import json
+import random
+import time
+from configs.defaultConfigs import config
+
+PHASES = ('search', 'selection', 'stateCopy', 'expansion', 'evaluation', 'backup', 'reroot')
+
+def _newSummary():
+    """
+    Record of a move, game or training iteration. Additive fields hold totals over the sampledMoves moves that were
+    instrumented, moves counts every move played
+    """
+    return {'games': 0, 'moves': 0, 'sampledMoves': 0, 'time': {phase: 0. for phase in PHASES}, 'simulations': 0,
+            'evaluations': 0, 'evaluatedInputs': 0, 'maxBatchSize': 0, 'treeSize': 0, 'maxTreeSize': 0, 'maxDepth': 0,
+            'cascadeLength': 0, 'maxCascadeLength': 0}
+
+def mergeSummary(summary, other):
+    for key, value in other.items():
+        if(key == 'time'):
+            for phase, seconds in value.items():
+                summary['time'][phase] += seconds
+        elif(key.startswith('max')):
+            summary[key] = max(summary[key], value)
+        elif(key in summary):
+            summary[key] += value
+    return summary
+
+def formatSummary(summary):
+    sampledMoves = max(summary['sampledMoves'], 1)
+    phaseTimes = ' '.join(f'{phase} {seconds:.2f}s' for phase, seconds in summary['time'].items())
+    return (f'{summary["moves"]} moves, {summary["sampledMoves"]} sampled: {phaseTimes}: '
+            f'simulations/move {summary["simulations"]/sampledMoves:.1f}: '
+            f'tree size mean {summary["treeSize"]/sampledMoves:.0f} max {summary["maxTreeSize"]}: '
+            f'max depth {summary["maxDepth"]}: '
+            f'cascade mean {summary["cascadeLength"]/sampledMoves:.2f} max {summary["maxCascadeLength"]}: '
+            f'nn batch mean {summary["evaluatedInputs"]/max(summary["evaluations"], 1):.1f} max {summary["maxBatchSize"]}')
+
+class Sink(object):
+    """
+    Receives the records of Instrumentation. Selection and expansion include the time spent in stateCopy and evaluation
+    """
+    def recordMove(self, record, game):
+        """
+        :param game: position the move was searched from
+        """
+        pass
+
+    def recordGame(self, record):
+        pass
+
+    def recordIteration(self, record):
+        pass
+
+    def close(self):
+        pass
+
+class PrintSink(Sink):
+    def __init__(self, printBoards = True):
+        self.printBoards = printBoards
+
+    def recordMove(self, record, game):
+        if(self.printBoards):
+            game.printGrid()
+        print(f'Played move: {tuple(record["move"])}. Time taken: {record["time"]["search"]:.3f}s: '
+              f'{record["simulations"]} simulations: tree size {record["treeSize"]}: max depth {record["maxDepth"]}: '
+              f'cascade {record["cascadeLength"]}')
+
+    def recordGame(self, record):
+        print(f'Game: {formatSummary(record)}')
+
+    def recordIteration(self, record):
+        print(f'Iteration {record["iteration"]}: {record["games"]} games: {formatSummary(record)}')
+
+class JsonLinesSink(Sink):
+    """
+    Appends every record as one json line tagged with its kind. Several processes may append to the same file
+    """
+    def __init__(self, path):
+        self.file = open(path, 'a', buffering=1)
+
+    def _write(self, kind, record):
+        self.file.write(json.dumps(dict(record, kind=kind, timestamp=time.time())) + '\n')
+
+    def recordMove(self, record, game):
+        self._write('move', record)
+
+    def recordGame(self, record):
+        self._write('game', record)
+
+    def recordIteration(self, record):
+        self._write('iteration', record)
+
+    def close(self):
+        self.file.close()
+
+class MemorySink(Sink):
+    def __init__(self):
+        self.moves = []
+        self.games = []
+        self.iterations = []
+
+    def recordMove(self, record, game):
+        self.moves.append(record)
+
+    def recordGame(self, record):
+        self.games.append(record)
+
+    def recordIteration(self, record):
+        self.iterations.append(record)
+
+class Instrumentation(object):
+    """
+    Per phase timings and search statistics of a random sampleRate fraction of the moves. Moves that are not sampled
+    only pay for checking active, so a sampleRate of 0 turns instrumentation off.
+    Every sampled move is sent to the sinks, games and training iterations as the summary of their sampled moves.
+    """
+    def __init__(self, sinks = (), sampleRate = 0., seed = None):
+        self.sinks = list(sinks)
+        self.sampleRate = sampleRate
+        self.rng = random.Random(seed)
+        self.active = False
+        self.move = None
+        self.game = _newSummary()
+        self.iteration = _newSummary()
+        self.numIterations = 0
+
+    def startMove(self):
+        self.active = self.sampleRate > 0 and self.rng.random() < self.sampleRate
+        if(self.active):
+            self.move = _newSummary()
+
+    def addTime(self, phase, startTime):
+        """
+        :param startTime: time.perf_counter() at the start of the phase
+        """
+        self.move['time'][phase] += time.perf_counter() - startTime
+
+    def addEvaluation(self, numInputs):
+        self.move['evaluations'] += 1
+        self.move['evaluatedInputs'] += numInputs
+        self.move['maxBatchSize'] = max(self.move['maxBatchSize'], numInputs)
+
+    def addDepth(self, depth):
+        self.move['maxDepth'] = max(self.move['maxDepth'], depth)
+
+    def endMove(self, searchedRoot, treeSize, newGame):
+        """
+        :param searchedRoot: root the move was searched from, with its selectedAction set
+        :param treeSize: nodes in the tree when the search ended
+        :param newGame: position after the move
+        """
+        if(not self.active):
+            self.game['moves'] += 1
+            return
+        move = self.move
+        move['moves'] = move['sampledMoves'] = 1
+        move['simulations'] = searchedRoot.simulations
+        move['treeSize'] = move['maxTreeSize'] = treeSize
+        move['cascadeLength'] = move['maxCascadeLength'] = newGame.lastCascadeLength
+        for sink in self.sinks:
+            sink.recordMove(dict(move, move=list(searchedRoot.selectedAction), player=searchedRoot.game.curPlayer),
+                            searchedRoot.game)
+        mergeSummary(self.game, move)
+        self.active = False
+
+    def endGame(self):
+        game = self.game
+        game['games'] = 1
+        self.game = _newSummary()
+        if(game['sampledMoves'] > 0):
+            for sink in self.sinks:
+                sink.recordGame(game)
+        mergeSummary(self.iteration, game)
+
+    def addSummary(self, summary):
+        """
+        Adds games summarized by takeSummary in another process to the current iteration
+        """
+        mergeSummary(self.iteration, summary)
+
+    def takeSummary(self):
+        """
+        :return: summary of the games of the current iteration, which starts over
+        """
+        summary = self.iteration
+        self.iteration = _newSummary()
+        return summary
+
+    def endIteration(self):
+        iteration = self.takeSummary()
+        iteration['iteration'] = self.numIterations
+        self.numIterations += 1
+        if(iteration['sampledMoves'] > 0):
+            for sink in self.sinks:
+                sink.recordIteration(iteration)
+
+_instrumentation = None
+
+def getInstrumentation():
+    """
+    :return: the Instrumentation of this process, made from config on first use. Sampled records are printed, with
+    config.instrumentationLog they are also appended to that json lines file
+    """
+    global _instrumentation
+    if(_instrumentation is None):
+        sinks = [PrintSink(config.printBoards)]
+        if(config.instrumentationLog is not None):
+            sinks.append(JsonLinesSink(config.instrumentationLog))
+        _instrumentation = Instrumentation(sinks, config.instrumentationSampleRate)
+    return _instrumentation
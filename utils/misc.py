@@ -1,4 +1,4 @@
-from env.ChainReaction import Game
+from env.ChainReaction import Game, getGameFromPlanes
 import numpy as np
 def transform(game: Game):
     """
@@ -6,11 +6,17 @@ def transform(game: Game):
     :param game: game state to be transformed
     :return: one hot image for all players where game.curPlayer is treated as the first player
     """
-    state = np.zeros((game.totalRows, game.totalCols, game.numPlayers))
-    offset = game.curPlayer
-    for i in range(game.totalRows):
-        for j in range(game.totalCols):
-            if(not(game.grid[i][j].isEmpty)):
-                state[i][j][(game.grid[i][j].playerIdx + offset) % game.numPlayers] = game.grid[i][j].numOrbs
+    state = game.getPlanes().astype(float)
+    if(game.curPlayer != 0):
+        state = np.roll(state, game.curPlayer, axis=2)
+    return state
 
-    return state
\ No newline at end of file
+def inverseTransform(state):
+    """
+    Inverse of transform
+    :param state: (totalRows, totalCols, numPlayers) image with the player to move first
+    :return: the game the image was made from
+    """
+    numPlayers = state.shape[2]
+    curPlayer = int(np.sum(state)) % numPlayers
+    return getGameFromPlanes(np.roll(state, -curPlayer, axis=2))
@@ -0,0 +1,47 @@
+from functools import lru_cache
+import numpy as np
+
+@lru_cache(maxsize=None)
+def getPermutations(totalRows, totalCols):
+    """
+    Symmetries of the board as permutations of the flattened cells: a board transformed by symmetry k has
+    transformed[i] = board[permutations[k][i]]. Square boards have the 8 rotations and reflections, other boards only the
+    4 that keep their shape. Symmetry 0 is the identity.
+    :return: read only (numSymmetries, totalRows*totalCols) int array
+    """
+    cells = np.arange(totalRows * totalCols).reshape(totalRows, totalCols)
+    if(totalRows == totalCols):
+        boards = [np.rot90(cells, k) for k in range(4)] + [np.fliplr(np.rot90(cells, k)) for k in range(4)]
+    else:
+        boards = [cells, np.rot90(cells, 2), np.flipud(cells), np.fliplr(cells)]
+    permutations = np.stack([board.ravel() for board in boards])
+    permutations.flags.writeable = False
+    return permutations
+
+@lru_cache(maxsize=None)
+def getInversePermutations(totalRows, totalCols):
+    inversePermutations = np.argsort(getPermutations(totalRows, totalCols), axis=1)
+    inversePermutations.flags.writeable = False
+    return inversePermutations
+
+def _permute(flat, permutations):
+    # permutations is a single permutation or one permutation per example
+    if(permutations.ndim == 1):
+        return flat[:, permutations]
+    return flat[np.arange(len(flat))[:, None], permutations]
+
+def transformStates(states, symmetryIdxs):
+    """
+    :param states: (N, totalRows, totalCols, numPlayers) array
+    :param symmetryIdxs: symmetry applied to all states or (N,) array with one symmetry per state
+    """
+    numStates, totalRows, totalCols, numPlayers = states.shape
+    permutations = getPermutations(totalRows, totalCols)[symmetryIdxs]
+    flat = _permute(states.reshape(numStates, totalRows * totalCols, numPlayers), permutations)
+    return flat.reshape(states.shape)
+
+def inverseTransformProbs(probs, symmetryIdxs, totalRows, totalCols):
+    """
+    Maps probabilities predicted for transformed states back onto the untransformed states
+    """
+    return _permute(probs, getInversePermutations(totalRows, totalCols)[symmetryIdxs])